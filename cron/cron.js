@@ -20,8 +20,22 @@ if (!supabaseUrl || !supabaseKey || !apiEndpoint) {
 
 const supabase = createClient(supabaseUrl, supabaseKey);
 
+// A failed ingest leaves the questions open and is retried with a growing delay, after
+// INGEST_MAX_ATTEMPTS failures the questions are expired anyway so a broken server can't stop expiry
+const ingestMaxAttempts = parseInt(process.env.INGEST_MAX_ATTEMPTS || '5', 10);
+const ingestRetryBaseMs = 10000;
+let failedIngests = 0;
+let nextIngestAt = 0;
+let running = false;
+
 // Cron job to run every 10 seconds
 cron.schedule('*/10 * * * * *', async () => {
+  // a run with a long ingest can outlast the interval, never send the same answers twice at once
+  if (running) {
+    console.log('Previous run still in progress, skipping.');
+    return;
+  }
+  running = true;
   console.log('Cron job started...');
   try {
     // Query the fdate table for expire_date
@@ -81,27 +95,43 @@ cron.schedule('*/10 * * * * *', async () => {
         }
       }
 
-      // Send data to API for users with 1 or more answers using correct format
-      for (const [userId, answers] of Object.entries(userAnswersMap)) {
-        if (answers.length > 0) {
-          console.log(`Sending data for user ${userId} with ${answers.length} answers`);
-          try {
-            const payload = {
-              user_id: parseInt(userId),
-              texts: answers
-            };
-            
-            const response = await axios.post(`${apiEndpoint}/classifyUser`, payload);
-            if (response.status !== 200) {
-              console.error(`Failed to send data for user ${userId}:`, response.data);
-            } else {
-              console.log(`Successfully sent data for user ${userId}.`);
-            }
-          } catch (apiError) {
-            console.error(`Error sending data to API for user ${userId}:`, apiError);
+      // Send every user's answers to the API in one bulk request, embedded in a single batched pass
+      const users = Object.entries(userAnswersMap)
+        .filter(([, answers]) => answers.length > 0)
+        .map(([userId, answers]) => ({ user_id: parseInt(userId), texts: answers }));
+
+      if (users.length > 0) {
+        if (Date.now() < nextIngestAt) {
+          console.log('Waiting before retrying the answer ingest.');
+          return;
+        }
+        console.log(`Sending answers for ${users.length} users`);
+        let ingested = false;
+        try {
+          const response = await axios.post(`${apiEndpoint}/ingestAnswers`, { users });
+          if (response.status !== 200) {
+            console.error('Failed to ingest answers:', response.data);
+          } else {
+            ingested = true;
+            console.log(`Successfully ingested answers for ${response.data.result?.users ?? users.length} users.`);
           }
+        } catch (apiError) {
+          console.error('Error sending answers to API:', apiError);
+        }
+        if (ingested) {
+          failedIngests = 0;
         } else {
-          console.log(`Skipping user ${userId} who only has ${answers.length} answers (less than 10)`);
+          failedIngests += 1;
+          // Leave the questions open so a later run retries, instead of losing this cycle's answers
+          if (failedIngests < ingestMaxAttempts) {
+            const delayMs = ingestRetryBaseMs * 2 ** (failedIngests - 1);
+            nextIngestAt = Date.now() + delayMs;
+            console.log(`Ingest failed (attempt ${failedIngests} of ${ingestMaxAttempts}), questions are not marked as expired, retrying in ${delayMs / 1000}s.`);
+            return;
+          }
+          console.error(`Ingest failed ${failedIngests} times, marking questions as expired without it.`);
+          failedIngests = 0;
+          nextIngestAt = 0;
         }
       }
 
@@ -124,5 +154,7 @@ cron.schedule('*/10 * * * * *', async () => {
     }
   } catch (error) {
     console.error('Error running cron job:', error);
+  } finally {
+    running = false;
   }
 });
\ No newline at end of file
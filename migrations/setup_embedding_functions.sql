@@ -0,0 +1,54 @@
+-- Database side of the server's answer ingest (/ingestAnswers), embedding cache refreshes and
+-- pgvector neighbour search (/run-gnn?user_ids=...). Idempotent, run it again after changing a function.
+-- The function bodies are embedding_store.UPDATE_USER_EMBEDDINGS_SQL and
+-- knn_provider.MATCH_USER_NEIGHBORS_SQL, keep them in sync (tests/test_migrations.py checks).
+
+-- Step 1: Enable pgvector
+CREATE EXTENSION IF NOT EXISTS vector;
+
+-- Step 2: Embedding columns on users. update_user_embeddings bumps updated_at, and
+-- EmbeddingCache only fetches rows newer than its last refresh
+ALTER TABLE users ADD COLUMN IF NOT EXISTS embedding vector(768);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS users_updated_at_idx ON users (updated_at);
+
+-- Step 3: Bulk embedding update used by /ingestAnswers, only existing users are updated
+create or replace function update_user_embeddings(ids bigint[], embeddings text[])
+returns table (id bigint)
+language sql as $$
+  update users u
+  set embedding = v.embedding::vector, updated_at = now()
+  from unnest(ids, embeddings) as v(id, embedding)
+  where u.id = v.id
+  returning u.id
+$$;
+
+-- Step 4: Top-k neighbour search used by PgvectorKNN, backed by an HNSW cosine index
+CREATE INDEX IF NOT EXISTS users_embedding_hnsw_idx ON users USING hnsw (embedding vector_cosine_ops);
+create or replace function match_user_neighbors(query_ids bigint[], k int, incoming boolean default false)
+returns table (query_id bigint, neighbor_id bigint, rank int)
+language sql stable as $$
+  -- the k nearest users of each query id
+  select q.id, n.id, n.rank
+  from users q
+  cross join lateral (
+    select u.id, (row_number() over (order by u.embedding <=> q.embedding))::int as rank
+    from users u
+    where u.id <> q.id and u.embedding is not null
+    order by u.embedding <=> q.embedding
+    limit k
+  ) n
+  where not incoming and q.id = any(query_ids)
+  union all
+  -- the users whose k nearest contain a query id, rank is the query's place in that list
+  select n.id, q.id, n.rank
+  from users q
+  cross join lateral (
+    select u.id, (row_number() over (order by u.embedding <=> q.embedding))::int as rank
+    from users u
+    where u.id <> q.id and u.embedding is not null
+    order by u.embedding <=> q.embedding
+    limit k
+  ) n
+  where incoming and q.embedding is not null and n.id = any(query_ids)
+$$;
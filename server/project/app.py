@@ -1,10 +1,30 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Query
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import os
-from sklearn.neighbors import NearestNeighbors
-from models import customGNN, PSYCHBERT, GeneticAlgorithm  
+from models import customGNN, PSYCHBERT, GeneticAlgorithm, PartitionSearch
+from knn_provider import PgvectorKNN, neighborhood_graph
+from graph_state import GraphState
+from embedding_store import EmbeddingCache, load_embeddings, encode_by_length, update_embeddings
+from embedding_store import iter_embedding_frames, EMBEDDINGS_MEDIA_TYPE, BINARY_DTYPES
+from batching import MicroBatcher
+from model_registry import ModelRegistry
+from inference import optimize_model, set_threads, warmup_data, drift
+from jobs import JobManager, JobQueueFull
+from metrics import REGISTRY, span, current_trace, SamplingProfiler
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pydantic import BaseModel
+from typing import List
 import numpy as np
+import threading
+import asyncio
+import json
+import time
+import uuid
+import contextvars
 import torch
 from torch_geometric.data import Data
 from contextlib import asynccontextmanager
@@ -13,19 +33,65 @@ load_dotenv()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # on startup cache the model
-    device = torch.device("cpu")
+    # on startup cache the latest model version from the registry (MODEL_REGISTRY_DIR),
+    # trained_customGNN.pth when the registry is empty
+    app.state.registry = ModelRegistry(os.getenv("MODEL_REGISTRY_DIR", "models"))
+    app.state.inference_threads = set_threads(os.getenv("INFERENCE_THREADS"), os.getenv("INFERENCE_INTEROP_THREADS"))
+    app.state.model_lock = asyncio.Lock()
+    # set by /models/reload?version=... without promote, the registry poller leaves a pinned version alone
+    app.state.pinned_version = None
     try:
-        model = customGNN(input_size=768, hidden_size=512, output_size=768).to(device)
-        model.load_state_dict(torch.load("trained_customGNN.pth", map_location=device))
-        model.eval()  # model on evaluation mode
-        app.state.cached_model = model
-        print("Cached model loaded successfully.")
+        app.state.served = load_served_model()
+        SERVING_VERSION.set(1, version=app.state.served.version)
+        print("Cached model loaded successfully:", app.state.served.version)
     except Exception as e:
         print("Error loading cached model:", e)
-        app.state.cached_model = None
+        app.state.served = None
+    # features, KNN graph and refined embeddings kept between /run-gnn calls
+    # KNN_INDEX picks the index from knn_graph.py: "exact" (default, updated incrementally), "rp" or "hnsw"
+    app.state.graph_state = GraphState(k=10, num_layers=4, index=os.getenv("KNN_INDEX", "exact"))
+
+    # blocking Supabase I/O and model inference run on a bounded pool, never on the event loop;
+    # grouping runs as admission-controlled background jobs
+    app.state.executor = ThreadPoolExecutor(max_workers=int(os.getenv("INFERENCE_WORKERS", "2")),
+                                            thread_name_prefix="inference")
+    app.state.jobs = JobManager(max_running=int(os.getenv("GROUPING_MAX_RUNNING", "1")),
+                                max_queued=int(os.getenv("GROUPING_MAX_QUEUED", "4")))
+    # answer ingest gets its own limits, so it neither waits behind grouping runs nor is rejected by them
+    app.state.ingest_jobs = JobManager(max_running=int(os.getenv("INGEST_MAX_RUNNING", "1")),
+                                       max_queued=int(os.getenv("INGEST_MAX_QUEUED", "4")))
+
+    # cache the classifier too, PSYCHBERT_LAZY=1 defers loading to the first classification
+    app.state.psychbert = None
+    app.state.psychbert_lock = threading.Lock()
+    if os.getenv("PSYCHBERT_LAZY", "0") != "1":
+        try:
+            app.state.psychbert = load_psychbert()
+            print("PSYCHBERT loaded successfully.")
+        except Exception as e:
+            print("Error loading PSYCHBERT:", e)
+    # concurrent /classifyUser requests are combined into one pipeline call
+    app.state.classify_batcher = MicroBatcher(
+        classify_texts,
+        max_batch_size=int(os.getenv("CLASSIFY_MAX_BATCH", "32")),
+        max_wait_ms=int(os.getenv("CLASSIFY_MAX_WAIT_MS", "10")),
+        executor=app.state.executor,
+    )
+    app.state.classify_batcher.start()
+    # answer texts are embedded with the sentence encoder train.py's embeddings come from, loaded on first ingest
+    app.state.sentence_encoder = None
+    app.state.sentence_encoder_lock = threading.Lock()
+    # MODEL_POLL_SECONDS > 0 hot-swaps in new registry versions as train.py promotes them
+    poll_seconds = float(os.getenv("MODEL_POLL_SECONDS", "0"))
+    app.state.model_poller = asyncio.create_task(poll_registry(poll_seconds)) if poll_seconds > 0 else None
     yield
     # cleanup if necessary.
+    if app.state.model_poller is not None:
+        app.state.model_poller.cancel()
+    await app.state.classify_batcher.stop()
+    app.state.jobs.shutdown()
+    app.state.ingest_jobs.shutdown()
+    app.state.executor.shutdown(wait=False, cancel_futures=True)
     
     print("Shutting down")
 
@@ -33,6 +99,71 @@ async def lifespan(app: FastAPI):
 app = FastAPI(lifespan=lifespan)
 
 
+# request / model metrics served by /metrics, stage spans live in metrics.py
+REQUEST_SECONDS = REGISTRY.histogram("mindsync_request_seconds", "Request latency", labels=("method", "route", "status"))
+REQUESTS = REGISTRY.counter("mindsync_requests_total", "Requests served", labels=("method", "route", "status"))
+IN_FLIGHT = REGISTRY.gauge("mindsync_requests_in_flight", "Requests being served")
+MODEL_LOAD_SECONDS = REGISTRY.gauge("mindsync_model_load_seconds", "Time the last model load took", labels=("model", "version"))
+SERVING_VERSION = REGISTRY.gauge("mindsync_model_serving", "1 for the customGNN version being served", labels=("version",))
+
+# PROFILING_ENABLED=1 lets a request ask for a sampling profile with ?profile=1 or an X-Profile: 1
+# header, the collapsed stacks are kept for the last few requests under /debug/profiles/{id}
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+profiles = OrderedDict()
+
+
+
+#per-request latency metrics, a Server-Timing header with the request's stage spans and the optional profiler
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    trace = []
+    token = current_trace.set(trace)
+    profiler = None
+    if PROFILING_ENABLED and (request.query_params.get("profile") == "1" or request.headers.get("x-profile") == "1"):
+        profiler = SamplingProfiler(interval=PROFILE_INTERVAL_MS / 1000).start()
+    IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["Server-Timing"] = ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in trace)
+        if profiler is not None:
+            profile_id = uuid.uuid4().hex
+            profiles[profile_id] = profiler.stop().collapsed()
+            while len(profiles) > 20:
+                profiles.popitem(last=False)
+            response.headers["X-Profile-Id"] = profile_id
+        return response
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        seconds = time.perf_counter() - start
+        IN_FLIGHT.inc(-1)
+        route = request.scope.get("route")
+        labels = {"method": request.method, "route": route.path if route is not None else "unmatched", "status": status}
+        REQUEST_SECONDS.observe(seconds, **labels)
+        REQUESTS.inc(**labels)
+        current_trace.reset(token)
+
+
+
+#prometheus text exposition of every counter, gauge and histogram
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+
+#collapsed stacks of a profiled request (flamegraph.pl / speedscope input)
+@app.get("/debug/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    if profile_id not in profiles:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profiles[profile_id])
+
+
 supabase: Client = create_client(
     os.getenv("SUPABASE_URL"),
     os.getenv("SUPABASE_KEY")
@@ -40,65 +171,318 @@ supabase: Client = create_client(
 
 
 
-#util function
+# optional on-disk embedding cache, refreshed by updated_at delta on every fetch
+embedding_cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_DIR")) if os.getenv("EMBEDDING_CACHE_DIR") else None
+
+
+
+#util function, runs a blocking call on the inference pool and awaits it, in the caller's context so its spans land in the request trace
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(app.state.executor, partial(context.run, fn, *args, **kwargs))
+
+
+
+#util function, returns the optimized model and its report after a warm-up pass that measures its drift from the eager model
+#INFERENCE_PRECISION=fp32|int8|bf16 and INFERENCE_BACKEND=eager|compile, anything that fails falls back to eager
+def setup_inference_model(eager_model):
+    report = {"threads": app.state.inference_threads, "precision": "fp32", "backend": "eager", "errors": []}
+    model = eager_model
+    try:
+        optimized, errors = optimize_model(eager_model, precision=os.getenv("INFERENCE_PRECISION", "fp32"),
+                                           backend=os.getenv("INFERENCE_BACKEND", "eager"))
+        report["errors"] = errors
+        report["warmup"] = drift(eager_model, optimized, warmup_data(int(os.getenv("INFERENCE_WARMUP_NODES", "256"))))
+        report.update({"precision": optimized.precision, "backend": optimized.backend})
+        if (optimized.precision, optimized.backend) != ("fp32", "eager"):
+            model = optimized
+        print("Inference mode:", report)
+    except Exception as e:
+        report["errors"].append(str(e))
+        print("Error setting up inference mode, using eager model:", e)
+    return model, report
+
+
+
+# one loaded model version, replaced as a whole on reload so a request that picked up a
+# ServedModel keeps a consistent version, model and report until it finishes
+class ServedModel:
+    def __init__(self, version, model, eager_model, metadata, inference_report):
+        self.version = version
+        self.model = model
+        self.eager_model = eager_model
+        self.metadata = metadata
+        self.inference_report = inference_report
+
+
+
+#util function, loads and warms up a registry version (latest when None), blocking
+def load_served_model(version=None):
+    registry = app.state.registry
+    start = time.perf_counter()
+    with span("model_load"):
+        if version is None and registry.latest() is None:
+            eager_model = customGNN(input_size=768, hidden_size=512, output_size=768)
+            eager_model.load_state_dict(torch.load("trained_customGNN.pth", map_location="cpu"))
+            eager_model.eval()  # model on evaluation mode
+            version, metadata = "trained_customGNN.pth", {}
+        else:
+            eager_model, metadata = registry.load(version)
+            version = metadata["version"]
+        model, report = setup_inference_model(eager_model)
+    MODEL_LOAD_SECONDS.set(time.perf_counter() - start, model="customGNN", version=version)
+    return ServedModel(version, model, eager_model, metadata, report)
+
+
+
+#util function, loads a version on the inference pool and swaps it in with a single assignment,
+#in-flight requests finish on the model they started with. follow_latest=True (the poller) gives way
+#to a version pinned while it waited for the lock
+async def reload_model(version=None, follow_latest=False):
+    async with app.state.model_lock:
+        if follow_latest and app.state.pinned_version is not None:
+            return app.state.served
+        served = await run_blocking(load_served_model, version)
+        previous, app.state.served = app.state.served, served
+        if previous is not None:
+            SERVING_VERSION.set(0, version=previous.version)
+        SERVING_VERSION.set(1, version=served.version)
+        print("Serving model version", served.version)
+    return served
+
+
+
+#util function, follows the registry's LATEST unless /models/reload pinned a version
+async def poll_registry(poll_seconds):
+    while True:
+        await asyncio.sleep(poll_seconds)
+        try:
+            if app.state.pinned_version is not None:
+                continue
+            latest = app.state.registry.latest()
+            if latest is not None and (app.state.served is None or latest != app.state.served.version):
+                await reload_model(latest, follow_latest=True)
+        except Exception as e:
+            print("Error reloading model:", e)
+
+
+
+#util function, loads the classifier and records how long it took
+def load_psychbert():
+    start = time.perf_counter()
+    with span("model_load"):
+        psychbert = PSYCHBERT()
+    MODEL_LOAD_SECONDS.set(time.perf_counter() - start, model="psychbert", version="")
+    return psychbert
+
+
+
+#util function, returns the cached classifier and loads it on first use
+def get_psychbert():
+    with app.state.psychbert_lock:
+        if app.state.psychbert is None:
+            app.state.psychbert = load_psychbert()
+        return app.state.psychbert
+
+
+
+#util function, returns the cached sentence encoder (EMBEDDING_MODEL, all-mpnet-base-v2 like train.py) and loads it on first use
+def get_sentence_encoder():
+    with app.state.sentence_encoder_lock:
+        if app.state.sentence_encoder is None:
+            from sentence_transformers import SentenceTransformer
+            model_name = os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2")
+            start = time.perf_counter()
+            with span("model_load"):
+                app.state.sentence_encoder = SentenceTransformer(model_name)
+            MODEL_LOAD_SECONDS.set(time.perf_counter() - start, model=model_name, version="")
+        return app.state.sentence_encoder
+
+
+
+#util function, embeds one batch of texts (blocking), batches are formed by encode_by_length
+def encode_sentences(texts):
+    return get_sentence_encoder().encode(texts, batch_size=len(texts), show_progress_bar=False)
+
+
+
+#util function, runs a supabase query (blocking) inside a span
+def supabase_execute(query):
+    with span("supabase_query"):
+        return query.execute()
+
+
+
+#util function, classifies a list of texts with the cached classifier (blocking)
+def classify_texts(texts, batch_size=16):
+    with span("classify"):
+        return get_psychbert().classify_batch(texts, batch_size=batch_size)
+
+
+
+#util function, streams (id, embedding) pages into one float32 array
 def fetchEmbeddings():
-    response = supabase.table("users").select("id, embedding").execute()
-    if not response.get("data"):
+    with span("fetch_embeddings"):
+        if embedding_cache is not None:
+            embeddings, user_ids = embedding_cache.refresh(supabase)
+        else:
+            embeddings, user_ids = load_embeddings(supabase, table="users")
+    if not user_ids:
         raise Exception("No data returned from Supabase")
-    
-    data = response["data"]
-    user_ids = [row["id"] for row in data]
-    embeddings = []
-    for row in data:
-        emb_str = row["embedding"]  # e.g. "[0.1, 0.2, ..., 0.768]"
-        emb_str = emb_str.strip("[]")
-        emb_values = list(map(float, emb_str.split(",")))
-        embeddings.append(emb_values)
-    return np.array(embeddings), user_ids
-
-
-#util function to generate edge list of k nearest neighbors for all users using sklearn but pgvector is also an option and probably faster
-def knn(embeddings: np.ndarray, k=10):
-    nbrs = NearestNeighbors(n_neighbors=k+1, metric="cosine").fit(embeddings)
-    distances, indices = nbrs.kneighbors(embeddings)
-    edge_list = []
-    for i, neighbors in enumerate(indices):
-        for neighbor in neighbors[1:]:
-            edge_list.append((i, neighbor))
-    return edge_list
-
-
-
-def create_data_object(embeddings: np.ndarray, edge_list: list):
-    edge_index = torch.tensor(edge_list, dtype=torch.long).t().contiguous()
+    return embeddings, user_ids
+
+
+def create_data_object(embeddings: np.ndarray, edge_index: torch.Tensor):
     x = torch.tensor(embeddings, dtype=torch.float)
     data = Data(x=x, edge_index=edge_index)
     return data
 
 
 
-#gnn for group cohesion and retrieving refined embeddings
+#refined embeddings for every user, shared by /run-gnn and the grouping jobs (blocking, run off the event loop)
+#only users that are new or changed since the last call (and their k-hop neighbourhood) are recomputed
+#refined embeddings are tagged with the model version, a new version invalidates them
+#returns (refined embeddings, user_ids, model version, graph version), the versions of exactly these rows
+def compute_refined_embeddings():
+    embeddings, user_ids = fetchEmbeddings()
+    
+    # Use the cached model instead of reloading every time.
+    served = app.state.served
+    if served is None:
+        raise HTTPException(status_code=500, detail="Model is not loaded.")
+    
+    with span("graph_sync"):
+        refined_embedding, graph_version = app.state.graph_state.sync(embeddings, user_ids, served.model,
+                                                                      model_version=served.version)
+    return refined_embedding, user_ids, served.version, graph_version
+
+
+
+#KNN_PROVIDER picks how /run-gnn?user_ids=... finds the users' neighbourhoods: "local" (default) refines every
+#user through GraphState and returns the requested rows, "pgvector" runs the top-k search in the database
+#(match_user_neighbors, see knn_provider.py) and only pulls the features of the users' num_layers-hop receptive
+#field, both give the same refined embeddings
+KNN_PROVIDER = os.getenv("KNN_PROVIDER", "local")
+
+
+
+#refined embeddings of some users (blocking, run off the event loop), returns the same tuple as
+#compute_refined_embeddings, the graph version is None when the rows come from a pgvector subgraph
+def compute_refined_subset(user_ids):
+    served = app.state.served
+    if served is None:
+        raise HTTPException(status_code=500, detail="Model is not loaded.")
+    user_ids = list(dict.fromkeys(user_ids))
+
+    if KNN_PROVIDER != "pgvector":
+        refined_embedding, all_ids, model_version, graph_version = compute_refined_embeddings()
+        rows = {u: i for i, u in enumerate(all_ids)}
+        missing = [u for u in user_ids if u not in rows]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Users not found: {missing[:10]}")
+        return refined_embedding[[rows[u] for u in user_ids]], user_ids, model_version, graph_version
+
+    graph_state = app.state.graph_state
+    provider = PgvectorKNN(supabase)
+    try:
+        with span("knn_pushdown"):
+            nodes, edge_index = neighborhood_graph(provider, user_ids, k=graph_state.k, num_layers=graph_state.num_layers)
+        with span("fetch_embeddings"):
+            x = provider.features(nodes)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    with span("gnn_forward"), torch.no_grad():
+        refined_embedding = served.model(create_data_object(x, edge_index))
+    return refined_embedding[: len(user_ids)], user_ids, served.version, None
+
+
+
+#gnn for group cohesion and retrieving refined embeddings, of every user or only of user_ids
+#JSON by default, "Accept: application/octet-stream" streams the raw rows instead (float32, or float16 with
+#?dtype=float16) after a JSON header with the user_ids, see embedding_store.py. the grouping jobs use
+#compute_refined_embeddings directly and never serialise
 @app.get("/run-gnn")
-async def run_gnn():
+async def run_gnn(request: Request, user_ids: List[int] = Query(None), dtype: str = "float32"):
+    binary = EMBEDDINGS_MEDIA_TYPE in request.headers.get("accept", "")
+    if binary and dtype not in BINARY_DTYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown dtype: {dtype}, expected one of {tuple(BINARY_DTYPES)}")
+
+    def run():
+        if user_ids:
+            refined_embedding, ids, model_version, graph_version = compute_refined_subset(user_ids)
+        else:
+            refined_embedding, ids, model_version, graph_version = compute_refined_embeddings()
+        refined_embedding = refined_embedding.cpu().numpy()
+        return (refined_embedding if binary else refined_embedding.tolist()), ids, model_version, graph_version
     try:
-        embeddings, user_ids = fetchEmbeddings()
-        edge_list = knn(embeddings, k=10)
-        data = create_data_object(embeddings, edge_list)
+        refined_embedding, ids, model_version, graph_version = await run_blocking(run)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-    device = torch.device("cpu")
-    # Use the cached model instead of reloading every time.
-    global cached_model
-    if cached_model is None:
+    meta = {"graph_version": graph_version, "model_version": model_version}
+    if binary:
+        return StreamingResponse(iter_embedding_frames(refined_embedding, ids, dtype=dtype, **meta),
+                                 media_type=EMBEDDINGS_MEDIA_TYPE, headers={"Vary": "Accept"})
+    # plain lists of floats and ints, JSONResponse skips FastAPI's jsonable_encoder walk over every value
+    return JSONResponse({"embeddings": refined_embedding, "user_ids": ids, **meta}, headers={"Vary": "Accept"})
+
+
+
+#registry versions and the one being served
+@app.get("/models")
+async def list_models():
+    registry = app.state.registry
+    served = app.state.served
+    return {
+        "serving": served.version if served else None,
+        "pinned": app.state.pinned_version,
+        "latest": registry.latest(),
+        "versions": [registry.metadata(version) for version in registry.versions()],
+    }
+
+
+
+#hot-swaps the serving model to a version (latest when omitted), promote=true also makes it the registry's LATEST.
+#a version without promote stays pinned (the registry poller no longer follows LATEST) until a reload
+#without a version or with promote=true
+@app.post("/models/reload")
+async def reload_models(version: str = None, promote: bool = False):
+    registry = app.state.registry
+    if version is not None and version not in registry.versions():
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {version}")
+    try:
+        if promote and version is not None:
+            registry.promote(version)
+        served = await reload_model(version)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    app.state.pinned_version = version if version is not None and not promote else None
+    return {"serving": served.version, "pinned": app.state.pinned_version is not None,
+            "metadata": served.metadata, "inference": served.inference_report}
+
+
+
+
+#inference mode in use, its warm-up drift and (live=true) its drift on the current user graph
+@app.get("/inference-mode")
+async def inference_mode(live: bool = False):
+    served = app.state.served
+    if served is None:
         raise HTTPException(status_code=500, detail="Model is not loaded.")
-    
-    data = data.to(device)
-    with torch.no_grad():
-        refined_embedding = cached_model(data)
-    
-    refined_embedding = refined_embedding.cpu().numpy().tolist()
-    return {"embeddings": refined_embedding, "user_ids": user_ids}
+    report = {**served.inference_report, "model_version": served.version}
+    if live:
+        graph_state = app.state.graph_state
+        if graph_state.x is None:
+            raise HTTPException(status_code=409, detail="No graph yet, call /run-gnn first.")
+        def run():
+            with graph_state.lock:
+                data = Data(x=torch.from_numpy(graph_state.x.copy()), edge_index=graph_state.edge_index())
+            return drift(served.eager_model, served.model, data)
+        report["live"] = await run_blocking(run)
+    return report
 
 
 
@@ -107,37 +491,187 @@ async def run_gnn():
 @app.post("/classifyUser")
 async def classify_user(user_id: int):
     try:
-        psychbert = PSYCHBERT()  
-        
-        response = supabase.table("users").select("text").eq("id", user_id).execute()
-        if not response.get("data"):
+        response = await run_blocking(supabase_execute, supabase.table("users").select("text").eq("id", user_id))
+        if not response.data:
             raise HTTPException(status_code=404, detail="User not found")
         
-        user_text = response["data"][0]["text"]
-        results = psychbert.classify_personality(user_text)
+        user_text = response.data[0]["text"]
+        results = await app.state.classify_batcher.submit(user_text)
         return results
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
-# heuristic genetic algorithm for group assignment
-@app.post("/groupUsers")
-async def group_users():
+class UserAnswers(BaseModel):
+    user_id: int
+    texts: List[str]
+
+
+
+class IngestAnswersRequest(BaseModel):
+    users: List[UserAnswers]
+    batch_size: int = 64
+    chunk_size: int = 500
+
+
+
+# answer ingest job: every user's answers joined into one text, all texts embedded in one length-sorted
+# pass and the embeddings of existing users updated in chunk_size-row writes (users.text is left alone)
+def ingest_answers_job(job, users, batch_size, chunk_size):
+    answers = {}
+    for user in users:
+        answers.setdefault(user.user_id, []).extend(text.strip() for text in user.texts if text and text.strip())
+    user_ids = [user_id for user_id, texts in answers.items() if texts]
+    texts = ["\n".join(answers[user_id]) for user_id in user_ids]
+    skipped = [user_id for user_id, texts in answers.items() if not texts]
+    if not user_ids:
+        return {"users": 0, "skipped": skipped, "missing": [], "updates": 0}
+
+    with span("encode_answers"):
+        vectors = encode_by_length(texts, encode_sentences, batch_size)
+    job.report({"stage": "encode", "users": len(user_ids)})
+
+    with span("update_embeddings"):
+        updated, updates = update_embeddings(supabase, user_ids, vectors, chunk_size=chunk_size)
+    job.report({"stage": "update", "updates": updates})
+    updated = set(updated)
+    return {"users": len(updated), "skipped": skipped, "missing": [u for u in user_ids if u not in updated],
+            "updates": updates}
+
+
+
+#bulk answer ingest for the question-expiry cron, replaces one /classifyUser call per user with a single
+#batched encode, returns the job summary
+@app.post("/ingestAnswers")
+async def ingest_answers(request: IngestAnswersRequest):
     try:
+        job = app.state.ingest_jobs.submit("ingestAnswers", ingest_answers_job, request.users, request.batch_size,
+                                           request.chunk_size)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Too many ingest jobs: {e}")
+    try:
+        await asyncio.wrap_future(job.future)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return job.summary()
+
+
+
+class ClassifyUsersRequest(BaseModel):
+    user_ids: List[int]
+    batch_size: int = 16
+
+
+
+#batch classification, one query for all texts and padded/truncated pipeline batches
+@app.post("/classifyUsers")
+async def classify_users(request: ClassifyUsersRequest):
+    try:
+        response = await run_blocking(supabase_execute, supabase.table("users").select("id, text").in_("id", request.user_ids))
+        texts = {row["id"]: row["text"] for row in response.data if row.get("text")}
+        found = [user_id for user_id in request.user_ids if user_id in texts]
         
-        gnn_results = await run_gnn()
-        user_ids = gnn_results["user_ids"]
-        
-        ga = GeneticAlgorithm(NUsers=len(user_ids), embeddings=gnn_results["embeddings"], minK=3, maxK=5)
+        results = []
+        if found:
+            results = await run_blocking(classify_texts, [texts[user_id] for user_id in found], request.batch_size)
+        return {
+            "results": [{"user_id": user_id, **result} for user_id, result in zip(found, results)],
+            "missing": [user_id for user_id in request.user_ids if user_id not in texts],
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+
+# group assignment job, "partition" (default) runs the constraint-aware local search,
+# "ga" runs the heuristic genetic algorithm. runs on a JobManager thread and reports every
+# generation / sweep of the logbook as job progress.
+def group_users_job(job, engine):
+    refined_embedding, user_ids, model_version, _ = compute_refined_embeddings()
+    embeddings = refined_embedding.cpu().numpy()
+    
+    # generation timing and fitness go to the job progress and /metrics instead of stdout
+    with span(f"grouping_{engine}"):
+        if engine == "ga":
+            ga = GeneticAlgorithm(NUsers=len(user_ids), embeddings=embeddings, minK=3, maxK=5)
+            best_individual, logbook = ga.run_genetic_algorithm(pop_size=50, n_gen=40, on_generation=job.report,
+                                                                n_workers=int(os.getenv("GA_WORKERS", "1")),
+                                                                verbose=False)
+        else:
+            search = PartitionSearch(NUsers=len(user_ids), embeddings=embeddings, minK=3, maxK=5)
+            best_individual, logbook = search.run_partition_search(on_generation=job.report, verbose=False)
+
+    # Process best_individual to extract final group assignments
+
+    group_assignments = list(best_individual)  # This is a list of group ids corresponding to each user
 
-        best_individual, logbook = ga.run_genetic_algorithm(pop_size=50, n_gen=40)
+    # k means clustering to validate group assignments could be used here
+    return {"group_assignments": group_assignments, "user_ids": user_ids, "model_version": model_version}
 
-        # Process best_individual to extract final group assignments
 
-        group_assignments = list(best_individual)  # This is a list of group ids corresponding to each user
 
-        # k means clustering to validate group assignments could be used here
-        return {"group_assignments": group_assignments, "user_ids": user_ids}
+def submit_grouping(engine):
+    if engine not in ("partition", "ga"):
+        raise HTTPException(status_code=400, detail=f"Unknown grouping engine: {engine}")
+    try:
+        return app.state.jobs.submit("groupUsers", group_users_job, engine)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Too many grouping jobs: {e}")
+
+
+
+# group assignment, waits for the job and returns the assignments
+@app.post("/groupUsers")
+async def group_users(engine: str = "partition"):
+    job = submit_grouping(engine)
+    try:
+        return await asyncio.wrap_future(job.future)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+
+# job API: submit, then poll /groupUsers/jobs/{job_id} or stream /groupUsers/jobs/{job_id}/events
+@app.post("/groupUsers/jobs", status_code=202)
+async def submit_group_users(engine: str = "partition"):
+    job = submit_grouping(engine)
+    return {"job_id": job.id, "status": job.status}
+
+
+
+@app.get("/groupUsers/jobs/{job_id}")
+async def group_users_status(job_id: str):
+    job = app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.summary()
+
+
+
+# server-sent events: one "progress" event per logbook record, then a final "status" event
+@app.get("/groupUsers/jobs/{job_id}/events")
+async def group_users_events(job_id: str, poll_ms: int = 500):
+    job = app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        sent = 0
+        while True:
+            finished = job.finished
+            while sent < len(job.progress):
+                yield f"event: progress\ndata: {json.dumps(job.progress[sent])}\n\n"
+                sent += 1
+            if finished:
+                yield f"event: status\ndata: {json.dumps(job.summary(include_result=False))}\n\n"
+                return
+            await asyncio.sleep(poll_ms / 1000)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
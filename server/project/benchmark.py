@@ -0,0 +1,219 @@
+from models import customGNN, GeneticAlgorithm, PartitionSearch
+from embedding_store import load_embeddings, parse_vectors, iter_embedding_frames
+from supabase_stub import LocalSupabase
+from knn_graph import build_edge_index
+from torch_geometric.data import Data
+import numpy as np
+import subprocess
+import threading
+import argparse
+import platform
+import base64
+import json
+import time
+import os
+import torch
+
+
+# Stage-by-stage benchmark of the /groupUsers pipeline on synthetic clustered embeddings.
+# For every size each stage is timed and a sampling thread records how far the process RSS rose
+# above its value at the start of the stage (Linux /proc/self/statm, so torch allocations count too):
+#   parse     parse_vectors on the raw pgvector text values
+#   fetch     load_embeddings (what fetchEmbeddings runs) against a LocalSupabase stub
+#   knn       build_edge_index, the KNN graph GraphState builds for /run-gnn
+#   data      Data object as built by create_data_object
+#   gnn       customGNN forward pass (random weights, serving sizes)
+#   json / f32 / f16  encoding the refined embeddings as a /run-gnn response, JSON or the binary
+#             float32 / float16 format, with the payload size in bytes
+#   ga_init   GeneticAlgorithm.__init__, i.e. the similarity backend
+#   ga_run    run_genetic_algorithm
+#   partition PartitionSearch init + run_partition_search (the default /groupUsers engine)
+# Grouping stages also report mean intra-group cosine and size violations. Results go to a
+# JSON file tagged with the git commit so runs can be compared across commits.
+#   python benchmark.py --sizes 1000,10000,100000 --output bench.json
+
+
+def synthetic_embeddings(n_users, dim=768, clusters=None, seed=0):
+    # users drawn around random cluster centres, roughly one cluster per 50 users
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(n_users // 50, 2)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    return centers[rng.integers(0, clusters, n_users)] + 0.5 * rng.standard_normal((n_users, dim)).astype(np.float32)
+
+
+def stub_client(embeddings, wire_format="text"):
+    if wire_format == "base64":
+        values = [base64.b64encode(v.astype("<f4").tobytes()).decode() for v in embeddings]
+    else:
+        values = ["[" + ",".join(f"{x:.6g}" for x in v) + "]" for v in embeddings]
+    return LocalSupabase({"users": [{"id": i + 1, "embedding": v} for i, v in enumerate(values)]}), values
+
+
+def group_quality(embeddings, assignment, min_k, max_k):
+    """
+    mean over groups of the mean pairwise cosine within the group (singletons skipped) and the
+    number of groups smaller than min_k or larger than max_k
+    """
+    x = np.asarray(embeddings, dtype=np.float32)
+    x = x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+    groups, assignment = np.unique(np.asarray(assignment), return_inverse=True)
+    sizes = np.bincount(assignment, minlength=len(groups))
+    sums = np.zeros((len(groups), x.shape[1]), dtype=np.float64)
+    np.add.at(sums, assignment, x)
+    # sum over pairs of x_i . x_j = (|sum|^2 - sum |x_i|^2) / 2, with |x_i| = 1
+    pair_sums = (np.einsum("ij,ij->i", sums, sums) - sizes) / 2
+    pairs = sizes * (sizes - 1) / 2
+    multi = pairs > 0
+    return {
+        "mean_intra_cosine": float(np.mean(pair_sums[multi] / pairs[multi])) if multi.any() else 0.0,
+        "size_violations": int(np.sum((sizes < min_k) | (sizes > max_k))),
+        "groups": int(len(groups)),
+    }
+
+
+def current_rss():
+    # resident set size in bytes, None where /proc/self/statm does not exist
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class RSSSampler:
+    # highest RSS seen every interval seconds between start() and stop()
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def start(self):
+        self.base = self.peak = current_rss()
+        if self.base is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self.base is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+        return self.peak - self.base
+
+
+def measure(fn):
+    """
+    runs fn() and returns (result, {"seconds", "rss_start_mb", "rss_peak_delta_mb"}), the peak RSS
+    during the stage minus the RSS at its start (None off Linux). peaks shorter than the 1 ms
+    sampling interval can be missed
+    """
+    sampler = RSSSampler().start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    delta = sampler.stop()
+    mb = lambda value: None if value is None else value / 2**20
+    return result, {"seconds": seconds, "rss_start_mb": mb(sampler.base), "rss_peak_delta_mb": mb(delta)}
+
+
+def run_size(n_users, args):
+    stages = {}
+    embeddings = synthetic_embeddings(n_users, args.dim, seed=args.seed)
+    client, values = stub_client(embeddings, args.wire_format)
+
+    _, stages["parse"] = measure(lambda: parse_vectors(values, args.dim, wire_format=args.wire_format))
+    (fetched, _), stages["fetch"] = measure(lambda: load_embeddings(client, table="users", dim=args.dim,
+                                                                    wire_format=args.wire_format))
+    del client, values
+
+    edge_index, stages["knn"] = measure(lambda: build_edge_index(fetched, k=args.k, index=args.index))
+    data, stages["data"] = measure(lambda: Data(x=torch.tensor(fetched, dtype=torch.float), edge_index=edge_index))
+
+    model = customGNN(input_size=args.dim, hidden_size=args.hidden, output_size=args.dim).eval()
+    def forward():
+        with torch.no_grad():
+            return model(data).numpy()
+    refined, stages["gnn"] = measure(forward)
+
+    # json.dumps is a lower bound for the JSON response, the server also builds the float lists
+    user_ids = list(range(1, n_users + 1))
+    payload, stages["json"] = measure(lambda: json.dumps({"embeddings": refined.tolist(), "user_ids": user_ids}).encode())
+    stages["json"]["bytes"] = len(payload)
+    for name, dtype in (("f32", "float32"), ("f16", "float16")):
+        payload, stages[name] = measure(lambda: b"".join(iter_embedding_frames(refined, user_ids, dtype=dtype)))
+        stages[name]["bytes"] = len(payload)
+    del payload
+
+    if n_users <= args.ga_max_users:
+        ga, stages["ga_init"] = measure(lambda: GeneticAlgorithm(NUsers=n_users, embeddings=refined, minK=3, maxK=5,
+                                                                 similarity=args.similarity))
+        (best, _), stages["ga_run"] = measure(lambda: ga.run_genetic_algorithm(pop_size=args.pop_size, n_gen=args.generations,
+                                                                               seed=args.seed, verbose=False))
+        stages["ga_run"].update(group_quality(refined, best, 3, 5))
+        del ga
+    else:
+        stages["ga_init"] = stages["ga_run"] = {"skipped": f"more than --ga-max-users={args.ga_max_users} users"}
+
+    def partition():
+        search = PartitionSearch(NUsers=n_users, embeddings=refined, minK=3, maxK=5, similarity=args.similarity)
+        return search.run_partition_search(seed=args.seed, verbose=False)
+    (best, _), stages["partition"] = measure(partition)
+    stages["partition"].update(group_quality(refined, best, 3, 5))
+    return {"users": n_users, "stages": stages}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the grouping pipeline stages on synthetic embeddings")
+    parser.add_argument("--sizes", default="1000,10000", help="comma separated user counts, e.g. 1000,10000,100000")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--hidden", type=int, default=512, help="customGNN hidden size")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--index", default="exact", help="knn_graph index: exact, rp or hnsw")
+    parser.add_argument("--similarity", default="auto", help="GeneticAlgorithm similarity backend")
+    parser.add_argument("--wire-format", default="text", choices=["text", "base64"])
+    parser.add_argument("--pop-size", type=int, default=50)
+    parser.add_argument("--generations", type=int, default=40)
+    parser.add_argument("--ga-max-users", type=int, default=10000, help="skip the GA stages above this size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "threads": torch.get_num_threads(),
+        "config": vars(args),
+        "results": [],
+    }
+    for n_users in [int(size) for size in args.sizes.split(",")]:
+        result = run_size(n_users, args)
+        report["results"].append(result)
+        for name, stage in result["stages"].items():
+            if "skipped" in stage:
+                print(f"{n_users:>8}  {name:<10} skipped")
+                continue
+            quality = f"  cos={stage['mean_intra_cosine']:.4f} violations={stage['size_violations']}" \
+                if "mean_intra_cosine" in stage else ""
+            if "bytes" in stage:
+                quality = f"  payload {stage['bytes'] / 2**20:9.1f} MB"
+            delta = stage["rss_peak_delta_mb"]
+            memory = "n/a" if delta is None else f"{delta:9.1f} MB"
+            print(f"{n_users:>8}  {name:<10} {stage['seconds']:9.3f}s  peak rss +{memory}{quality}")
+        # rewritten after every size so a long run still leaves partial results
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
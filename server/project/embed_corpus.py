@@ -0,0 +1,159 @@
+from embedding_store import encode_by_length
+import numpy as np
+import argparse
+import hashlib
+import logging
+import json
+import glob
+import time
+import os
+
+
+# Embedding-generation stage for train.py.
+# Texts are encoded into a content-addressed cache: one directory per model, holding shards of
+# float32 vectors (shard-*.npy) with the sha256 of every text they encode (shard-*.json). Only
+# texts whose hash is not cached yet are encoded, longest first in sorted-by-length batches, and
+# every shard is written with a temp file + rename, so an interrupted run resumes from the last
+# complete shard. export() writes the corpus in order as embeddings.npy + ids.json, which load
+# memory-mapped without parsing.
+
+logger = logging.getLogger("train_logger")
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TextEmbeddingCache:
+    def __init__(self, directory, model_name):
+        self.model_name = model_name
+        self.directory = os.path.join(directory, model_name.replace("/", "__"))
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def index(self):
+        # {text hash: (shard path, row)} over every complete shard
+        index = {}
+        for keys_path in sorted(glob.glob(self._path("shard-*.json"))):
+            with open(keys_path) as f:
+                keys = json.load(f)
+            vectors_path = keys_path[:-len(".json")] + ".npy"
+            for row, key in enumerate(keys):
+                index.setdefault(key, (vectors_path, row))
+        return index
+
+    def _write_shard(self, keys, vectors):
+        # vectors before keys, a shard only counts once its key list exists
+        name = f"shard-{time.time_ns()}-{os.getpid()}"
+        with open(self._path(name + ".npy.tmp"), "wb") as f:
+            np.save(f, np.asarray(vectors, dtype=np.float32), allow_pickle=False)
+        os.replace(self._path(name + ".npy.tmp"), self._path(name + ".npy"))
+        with open(self._path(name + ".json.tmp"), "w") as f:
+            json.dump(keys, f)
+        os.replace(self._path(name + ".json.tmp"), self._path(name + ".json"))
+
+    def update(self, texts, encode, batch_size=64, shard_size=4096):
+        """
+        encodes the texts that are not cached yet with encode(list of texts) -> [n, dim] and
+        returns how many were encoded. pending texts are sorted by length so batches pad little
+        and are flushed to a new shard every shard_size texts
+        """
+        cached = self.index()
+        pending = {}
+        for text in texts:
+            key = text_key(text)
+            if key not in cached:
+                pending.setdefault(key, text)
+        if not pending:
+            return 0
+        order = sorted(pending, key=lambda key: len(pending[key]), reverse=True)
+        logger.info(f"Encoding {len(order)} new texts ({len(cached)} cached) with {self.model_name}...")
+        for start in range(0, len(order), shard_size):
+            keys = order[start:start + shard_size]
+            vectors = encode_by_length([pending[key] for key in keys], encode, batch_size)
+            self._write_shard(keys, vectors)
+            logger.info(f"Encoded {min(start + shard_size, len(order))}/{len(order)} texts.")
+        return len(order)
+
+    def export(self, texts, ids, output_dir):
+        """
+        writes the cached vectors of texts, in order, to output_dir/embeddings.npy with
+        output_dir/ids.json and returns (embeddings memmap [N, dim], ids)
+        """
+        index = self.index()
+        os.makedirs(output_dir, exist_ok=True)
+        shards = {}
+        out = None
+        tmp = os.path.join(output_dir, f"embeddings.npy.{os.getpid()}.tmp")
+        for i, text in enumerate(texts):
+            path, row = index[text_key(text)]
+            if path not in shards:
+                shards[path] = np.load(path, mmap_mode="r")
+            if out is None:
+                out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(len(texts), shards[path].shape[1]))
+            out[i] = shards[path][row]
+        out.flush()
+        del out, shards
+        os.replace(tmp, os.path.join(output_dir, "embeddings.npy"))
+        tmp = os.path.join(output_dir, f"ids.json.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(list(ids), f)
+        os.replace(tmp, os.path.join(output_dir, "ids.json"))
+        return load_embeddings(output_dir)
+
+
+def load_embeddings(output_dir):
+    # (embeddings memmap [N, dim], ids) written by export
+    with open(os.path.join(output_dir, "ids.json")) as f:
+        ids = json.load(f)
+    return np.load(os.path.join(output_dir, "embeddings.npy"), mmap_mode="r"), ids
+
+
+def load_corpus(dataset="jingjietan/essays-big5"):
+    # (user ids, texts) for every split, ids are "<split>_<n>" as in the original CSV
+    from datasets import load_dataset
+    ds = load_dataset(dataset)
+    ids, texts = [], []
+    for split, prefix in (("train", "train"), ("validation", "val"), ("test", "test")):
+        for idx, row in enumerate(ds[split]):
+            ids.append(f"{prefix}_{idx + 1}")
+            texts.append(row["text"])
+    return ids, texts
+
+
+def build_embeddings(output_dir="embeddings", cache_dir="embedding_cache", model_name="all-mpnet-base-v2",
+                     batch_size=64, shard_size=4096):
+    """
+    runs the stage, encoding only texts missing from the cache, and returns
+    (embeddings memmap [N, dim], user_ids). the sentence-transformers model is only loaded
+    when something has to be encoded
+    """
+    ids, texts = load_corpus()
+    cache = TextEmbeddingCache(cache_dir, model_name)
+    model = None
+
+    def encode(batch):
+        nonlocal model
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name)
+        return model.encode(batch, batch_size=batch_size, show_progress_bar=False)
+
+    cache.update(texts, encode, batch_size=batch_size, shard_size=shard_size)
+    embeddings, user_ids = cache.export(texts, ids, output_dir)
+    logger.info(f"Embeddings for {len(user_ids)} users written to {output_dir}.")
+    return embeddings, user_ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encode the essays-big5 corpus into a cached, resumable embedding file")
+    parser.add_argument("--output", default="embeddings", help="directory for embeddings.npy and ids.json")
+    parser.add_argument("--cache", default="embedding_cache", help="content-hash cache directory")
+    parser.add_argument("--model", default="all-mpnet-base-v2")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--shard-size", type=int, default=4096, help="texts per resumable shard")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    build_embeddings(args.output, args.cache, args.model, args.batch_size, args.shard_size)
@@ -0,0 +1,346 @@
+from datetime import datetime, timezone
+import numpy as np
+import threading
+import base64
+import struct
+import json
+import io
+import os
+
+
+# Embedding ingest for the server.
+# Pages of (id, embedding) rows are streamed with keyset pagination and parsed straight into a
+# preallocated float32 array: pgvector text values are parsed by one np.loadtxt call per
+# page instead of building Python float lists per row, and a "base64" wire format (little-endian float32
+# bytes, e.g. a view column encode(float4send-ed vector, 'base64')) skips text parsing entirely.
+# EmbeddingCache keeps a memory-mapped .npy copy plus an id index on disk and only pulls rows
+# whose updated_at is newer than the last refresh.
+# The write side: encode_by_length embeds texts in length-sorted batches and update_embeddings
+# writes the vectors of existing users back in chunked bulk updates (UPDATE_USER_EMBEDDINGS_SQL).
+# iter_embedding_frames / read_embedding_frames are the binary /run-gnn response format: a
+# little-endian uint32 header length, a JSON header {"user_ids", "shape", "dtype", ...}, then the
+# rows as raw little-endian float32 or float16, row-major.
+
+EMBEDDINGS_MEDIA_TYPE = "application/octet-stream"
+BINARY_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+
+def _rows(response):
+    # supabase-py responses expose .data, older code paths index them like dicts
+    data = getattr(response, "data", None)
+    if data is None and isinstance(response, dict):
+        data = response.get("data")
+    return data or []
+
+
+def parse_vectors(values, dim, out=None, wire_format="text"):
+    """
+    parses a page of embedding values into float32 rows of out (allocated when None)
+    """
+    if out is None:
+        out = np.empty((len(values), dim), dtype=np.float32)
+    if not values:
+        return out
+    if wire_format == "base64":
+        flat = np.frombuffer(b"".join(base64.b64decode(v) for v in values), dtype="<f4")
+    elif isinstance(values[0], str):
+        # "[0.1,0.2,...]" -> one line per vector, parsed by numpy's C reader for the whole page
+        text = io.StringIO("\n".join(v.strip()[1:-1] for v in values))
+        flat = np.loadtxt(text, delimiter=",", dtype=np.float32, ndmin=2).ravel()
+    else:
+        flat = np.asarray(values, dtype=np.float32).ravel()
+    if flat.size != len(values) * dim:
+        raise ValueError(f"Expected {len(values)} embeddings of size {dim}, got {flat.size} values")
+    out[:] = flat.reshape(len(values), dim)
+    return out
+
+
+def format_vectors(vectors):
+    # float32 rows -> pgvector text values "[0.1,0.2,...]", the inverse of parse_vectors
+    if not len(vectors):
+        return []
+    text = io.StringIO()
+    np.savetxt(text, np.asarray(vectors, dtype=np.float32), fmt="%.7g", delimiter=",")
+    return ["[" + line + "]" for line in text.getvalue().splitlines()]
+
+
+def encode_by_length(texts, encode, batch_size=64):
+    """
+    encodes texts with encode(list of texts) -> [n, dim] in batches of similar length, longest
+    first so little is padded, and returns float32 [len(texts), dim] in the input order
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    out = None
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        vectors = np.asarray(encode([texts[i] for i in batch]), dtype=np.float32)
+        if out is None:
+            out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        out[batch] = vectors
+    return out if out is not None else np.empty((0, 0), dtype=np.float32)
+
+
+# PostgREST can only bulk-write different values per row through an upsert, which would insert
+# unknown ids and trips NOT NULL columns, so the bulk update is a function. updated_at is bumped
+# for EmbeddingCache. Created by migrations/setup_embedding_functions.sql, keep the two in sync.
+UPDATE_USER_EMBEDDINGS_SQL = """
+create or replace function update_user_embeddings(ids bigint[], embeddings text[])
+returns table (id bigint)
+language sql as $$
+  update users u
+  set embedding = v.embedding::vector, updated_at = now()
+  from unnest(ids, embeddings) as v(id, embedding)
+  where u.id = v.id
+  returning u.id
+$$;
+"""
+
+
+def update_embeddings(client, user_ids, vectors, function="update_user_embeddings", chunk_size=500):
+    """
+    sets the embedding of existing users, chunk_size users per round-trip, and returns
+    (updated user ids, round-trips). ids without a row are not created
+    """
+    user_ids = list(user_ids)
+    values = format_vectors(vectors)
+    updated, writes = [], 0
+    for start in range(0, len(user_ids), chunk_size):
+        rows = _rows(client.rpc(function, {"ids": user_ids[start:start + chunk_size],
+                                           "embeddings": values[start:start + chunk_size]}).execute())
+        updated.extend(row["id"] for row in rows)
+        writes += 1
+    return updated, writes
+
+
+def update_user_embeddings_stub(table="users", id_column="id", column="embedding", updated_column="updated_at"):
+    # UPDATE_USER_EMBEDDINGS_SQL for LocalSupabase(functions=...)
+    def update(client, ids, embeddings):
+        values = dict(zip(ids, embeddings))
+        now = datetime.now(timezone.utc).isoformat()
+        updated = []
+        for row in client.tables.setdefault(table, []):
+            if row.get(id_column) in values:
+                row[column] = values[row[id_column]]
+                row[updated_column] = now
+                updated.append({"id": row[id_column]})
+        return updated
+    return update
+
+
+def iter_embedding_frames(embeddings, user_ids, dtype="float32", chunk_rows=1024, **meta):
+    """
+    yields the binary response for embeddings [N, dim], the header then chunk_rows rows at a time.
+    float32 chunks are views of the array, float16 ones are converted a chunk at a time
+    """
+    if dtype not in BINARY_DTYPES:
+        raise ValueError(f"Unknown dtype: {dtype}, expected one of {tuple(BINARY_DTYPES)}")
+    embeddings = np.ascontiguousarray(embeddings)
+    header = json.dumps({"user_ids": list(user_ids), "shape": list(embeddings.shape), "dtype": dtype, **meta}).encode()
+    yield struct.pack("<I", len(header)) + header
+    for start in range(0, len(embeddings), chunk_rows):
+        chunk = embeddings[start:start + chunk_rows]
+        if chunk.dtype != np.dtype(BINARY_DTYPES[dtype]):
+            chunk = chunk.astype(BINARY_DTYPES[dtype])
+        yield memoryview(chunk).cast("B")
+
+
+def read_embedding_frames(payload):
+    # (embeddings [N, dim] in the payload's dtype, header) of a binary response
+    (length,) = struct.unpack_from("<I", payload)
+    header = json.loads(bytes(payload[4:4 + length]))
+    embeddings = np.frombuffer(payload, dtype=BINARY_DTYPES[header["dtype"]], offset=4 + length)
+    return embeddings.reshape(header["shape"]), header
+
+
+def stream_embeddings(client, table="users", id_column="id", column="embedding", dim=768,
+                      page_size=1000, wire_format="text", updated_column=None, since=None):
+    """
+    yields (ids, float32 [n, dim] array, max updated_column value) per page, ordered by id.
+    since restricts the stream to rows with updated_column > since.
+    """
+    columns = f"{id_column}, {column}" + (f", {updated_column}" if updated_column else "")
+    last_id = None
+    while True:
+        query = client.table(table).select(columns)
+        if since is not None:
+            query = query.gt(updated_column, since)
+        if last_id is not None:
+            query = query.gt(id_column, last_id)
+        page = _rows(query.order(id_column).limit(page_size).execute())
+        if not page:
+            return
+        # users without an embedding yet are skipped, but still count towards a full page
+        rows = [row for row in page if row.get(column) is not None]
+        if rows:
+            ids = [row[id_column] for row in rows]
+            vectors = parse_vectors([row[column] for row in rows], dim, wire_format=wire_format)
+            watermark = max((row[updated_column] for row in rows if row.get(updated_column)), default=None) \
+                if updated_column else None
+            yield ids, vectors, watermark
+        last_id = page[-1][id_column]
+        if len(page) < page_size:
+            return
+
+
+def _count(client, table, id_column):
+    try:
+        return getattr(client.table(table).select(id_column, count="exact", head=True).execute(), "count", None)
+    except Exception:
+        return None
+
+
+def _collect(pages, capacity, dim):
+    # writes streamed pages into one preallocated float32 buffer, returns (array, ids, watermark)
+    out = np.empty((capacity or 1024, dim), dtype=np.float32)
+    user_ids, watermark = [], None
+    for ids, vectors, page_watermark in pages:
+        end = len(user_ids) + len(ids)
+        if end > len(out):
+            # table grew since the count (or no count), double the buffer
+            grown = np.empty((max(end, 2 * len(out)), dim), dtype=np.float32)
+            grown[: len(user_ids)] = out[: len(user_ids)]
+            out = grown
+        out[len(user_ids):end] = vectors
+        user_ids.extend(ids)
+        if page_watermark is not None and (watermark is None or page_watermark > watermark):
+            watermark = page_watermark
+    return out[: len(user_ids)], user_ids, watermark
+
+
+def load_embeddings(client, table="users", id_column="id", column="embedding", dim=768,
+                    page_size=1000, wire_format="text"):
+    """
+    loads every embedding into one float32 array, returns (embeddings [N, dim], user_ids)
+    """
+    pages = stream_embeddings(client, table, id_column, column, dim, page_size, wire_format)
+    embeddings, user_ids, _ = _collect(pages, _count(client, table, id_column), dim)
+    return embeddings, user_ids
+
+
+class EmbeddingCache:
+    # directory/embeddings.npy  float32 [N, dim], opened memory-mapped
+    # directory/ids.json        user id of every row
+    # directory/meta.json       {"watermark": max updated_at seen, "dim": dim}
+    # refresh() runs one at a time, and files are only ever replaced, never patched in place,
+    # so an array returned earlier keeps the contents it had
+    def __init__(self, directory, table="users", id_column="id", column="embedding",
+                 updated_column="updated_at", dim=768, page_size=1000, wire_format="text"):
+        self.directory = directory
+        self.table = table
+        self.id_column = id_column
+        self.column = column
+        self.updated_column = updated_column
+        self.dim = dim
+        self.page_size = page_size
+        self.wire_format = wire_format
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def load(self):
+        # cached (embeddings memmap, user_ids, watermark), or None when there is no cache yet
+        if not os.path.exists(self._path("meta.json")):
+            return None
+        with open(self._path("meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("dim") != self.dim:
+            return None
+        with open(self._path("ids.json")) as f:
+            user_ids = json.load(f)
+        embeddings = np.load(self._path("embeddings.npy"), mmap_mode="r")
+        return embeddings, user_ids, meta.get("watermark")
+
+    def _tmp(self, name):
+        # unique per writer, so an interrupted or concurrent write never renames someone else's file
+        return self._path(f"{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    def _write_json(self, name, value):
+        tmp = self._tmp(name)
+        with open(tmp, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp, self._path(name))
+
+    def _write(self, embeddings, user_ids, watermark):
+        # new arrays go to temp files first and are swapped in, meta.json last, so an
+        # interrupted write leaves the previous cache (and watermark) intact
+        tmp = self._tmp("embeddings.npy")
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(len(user_ids), self.dim))
+        out[:] = embeddings
+        out.flush()
+        del out
+        os.replace(tmp, self._path("embeddings.npy"))
+        self._write_json("ids.json", list(user_ids))
+        self._write_json("meta.json", {"watermark": watermark, "dim": self.dim})
+
+    def _stream(self, client, since=None):
+        return stream_embeddings(client, self.table, self.id_column, self.column, self.dim,
+                                 self.page_size, self.wire_format, self.updated_column, since)
+
+    def _all_ids(self, client):
+        ids, last_id = [], None
+        while True:
+            query = client.table(self.table).select(self.id_column)
+            if last_id is not None:
+                query = query.gt(self.id_column, last_id)
+            rows = _rows(query.order(self.id_column).limit(self.page_size * 10).execute())
+            ids.extend(row[self.id_column] for row in rows)
+            if len(rows) < self.page_size * 10:
+                return ids
+            last_id = ids[-1]
+
+    def refresh(self, client, prune=True):
+        """
+        brings the cache up to date and returns (embeddings memmap [N, dim], user_ids).
+        the first call (or a cache without a watermark) loads everything, later calls only
+        fetch rows updated since the last one. prune drops users that no longer exist, which
+        costs one id-only scan.
+        """
+        with self.lock:
+            return self._refresh(client, prune)
+
+    def _refresh(self, client, prune):
+        cached = self.load()
+        if cached is None or cached[2] is None or not self.updated_column:
+            vectors, ids, watermark = _collect(self._stream(client), _count(client, self.table, self.id_column), self.dim)
+            self._write(vectors, ids, watermark)
+            cached = self.load()
+            return cached[0], cached[1]
+
+        embeddings, user_ids, watermark = cached
+        rows = {u: i for i, u in enumerate(user_ids)}
+        changed_rows, changed_vectors, new_ids, new_vectors = [], [], [], []
+        for ids, vectors, page_watermark in self._stream(client, since=watermark):
+            for u, v in zip(ids, vectors):
+                if u in rows:
+                    changed_rows.append(rows[u])
+                    changed_vectors.append(v)
+                else:
+                    new_ids.append(u)
+                    new_vectors.append(v)
+            if page_watermark is not None and page_watermark > watermark:
+                watermark = page_watermark
+
+        keep = None
+        if prune:
+            live = set(self._all_ids(client))
+            if len(live) != len(user_ids) + len(new_ids) or any(u not in live for u in user_ids):
+                keep = np.array([u in live for u in user_ids], dtype=bool)
+
+        if new_ids or changed_rows or keep is not None:
+            # a new file even when only rows changed, callers may still hold the old memmap
+            merged = np.concatenate([np.asarray(embeddings), np.asarray(new_vectors, dtype=np.float32).reshape(-1, self.dim)])
+            if changed_rows:
+                merged[changed_rows] = changed_vectors
+            merged_ids = list(user_ids) + new_ids
+            if keep is not None:
+                mask = np.concatenate([keep, np.ones(len(new_ids), dtype=bool)])
+                merged = merged[mask]
+                merged_ids = [u for u, k in zip(merged_ids, mask) if k]
+            del embeddings
+            self._write(merged, merged_ids, watermark)
+        else:
+            self._write_json("meta.json", {"watermark": watermark, "dim": self.dim})
+        cached = self.load()
+        return cached[0], cached[1]
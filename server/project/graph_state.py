@@ -0,0 +1,152 @@
+from torch_geometric.data import Data
+from torch_geometric.utils import k_hop_subgraph
+from knn_graph import make_index, query_neighbors
+from metrics import span
+import numpy as np
+import threading
+import torch
+
+
+# GraphState keeps the /run-gnn inputs and outputs alive between requests: node features,
+# the KNN index and neighbour lists, and the last refined embeddings. A sync with a new
+# snapshot only re-queries the neighbour lists that can have changed and re-runs the GNN on
+# the k-hop receptive field of the nodes whose output can have changed. Everything else is
+# reused. Removed users, a different model (or model version) or a large change fall back to a
+# full rebuild, so refined embeddings are never served from a stale model.
+# index is a knn_graph index name ("exact", "rp", "hnsw"). Incremental neighbour updates need an
+# index with update() (ExactIndex), with an approximate index any change rebuilds the graph.
+
+class GraphState:
+    def __init__(self, k=10, num_layers=4, full_rebuild_ratio=0.5, index="exact", block_size=2048, **index_kwargs):
+        self.k = k
+        self.index_name = index
+        self.index_kwargs = index_kwargs
+        self.block_size = block_size
+        self.num_layers = num_layers  # message passing depth of the model (GATv2Conv x4)
+        self.full_rebuild_ratio = full_rebuild_ratio
+        self.version = 0
+        self.user_ids = []
+        self.rows = {}
+        self.x = None
+        self.index = None
+        self.neighbors = None
+        self.refined = None
+        self.model = None
+        self.model_version = None
+        self.last_update = {}
+        self.lock = threading.Lock()
+
+    def edge_index(self):
+        src = np.repeat(np.arange(len(self.neighbors)), self.neighbors.shape[1])
+        return torch.from_numpy(np.stack([src, self.neighbors.ravel()]))
+
+    def sync(self, embeddings, user_ids, model, model_version=None):
+        """
+        brings the state in line with a full (embeddings, user_ids) snapshot and returns
+        (refined embeddings as a tensor in user_ids order, graph version they come from). the
+        cached embeddings are tagged with model_version and recomputed when it changes
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self.lock:
+            if self._needs_rebuild(user_ids, model, model_version):
+                self.model_version = model_version
+                self._rebuild(embeddings, user_ids, model)
+            else:
+                rows = np.array([self.rows.get(u, -1) for u in user_ids], dtype=np.int64)
+                known = rows >= 0
+                changed = np.flatnonzero(known)
+                changed = changed[np.any(self.x[rows[changed]] != embeddings[changed], axis=1)]
+                new = np.flatnonzero(~known)
+                if len(changed) or len(new):
+                    self._update(rows[changed], embeddings[changed],
+                                 [user_ids[i] for i in new], embeddings[new])
+                else:
+                    self.last_update = {"mode": "unchanged", "version": self.version, "recomputed": 0}
+            self.last_update["model_version"] = self.model_version
+            rows = torch.as_tensor([self.rows[u] for u in user_ids], dtype=torch.long)
+            return self.refined[rows], self.version
+
+    def _needs_rebuild(self, user_ids, model, model_version=None):
+        if self.x is None or model is not self.model or model_version != self.model_version:
+            return True
+        # the neighbour count is capped by the graph size until it exceeds k
+        if len(self.x) <= self.k:
+            return True
+        return len(self.rows.keys() - set(user_ids)) > 0
+
+    def _forward(self, x, edge_index):
+        with span("gnn_forward"), torch.no_grad():
+            return self.model(Data(x=torch.from_numpy(x), edge_index=edge_index))
+
+    def _rebuild(self, embeddings, user_ids, model):
+        self.model = model
+        self.user_ids = list(user_ids)
+        self.rows = {u: i for i, u in enumerate(self.user_ids)}
+        self.x = embeddings.copy()
+        with span("knn"):
+            self.index = make_index(self.index_name, **self.index_kwargs).fit(self.x)
+            k = min(self.k, len(self.x) - 1)
+            self.neighbors = query_neighbors(self.index, self.index.data, np.arange(len(self.x)), k)
+        self.refined = self._forward(self.x, self.edge_index())
+        self.version += 1
+        self.last_update = {"mode": "full", "version": self.version, "recomputed": len(self.x)}
+
+    def _update(self, changed_rows, changed_embeddings, new_ids, new_embeddings):
+        old_n = len(self.x)
+        new_rows = np.arange(old_n, old_n + len(new_ids))
+        touched = np.concatenate([changed_rows, new_rows])
+        n = old_n + len(new_ids)
+        x = np.concatenate([self.x, new_embeddings]) if len(new_ids) else self.x.copy()
+        x[changed_rows] = changed_embeddings
+        if len(touched) > self.full_rebuild_ratio * n or not hasattr(self.index, "update"):
+            self._rebuild(x, self.user_ids + list(new_ids), self.model)
+            return
+
+        with span("knn"):
+            self.index.update(touched, x[touched])
+            data = self.index.data
+
+            # neighbour lists that can change: the touched rows, rows that had a touched neighbour,
+            # and rows for which a touched row is now closer than their current k-th neighbour
+            old_neighbors = self.neighbors
+            kth = np.einsum("ij,ij->i", data[:old_n], data[old_neighbors[:, -1]])
+            enters = np.zeros(old_n, dtype=bool)
+            for start in range(0, old_n, self.block_size):
+                block = data[start:min(start + self.block_size, old_n)] @ data[touched].T
+                enters[start:start + len(block)] = (block > kth[start:start + len(block), None]).any(axis=1)
+            has_touched = np.isin(old_neighbors, touched).any(axis=1)
+            dirty = np.union1d(touched, np.flatnonzero(enters | has_touched))
+
+            neighbors = np.concatenate([old_neighbors, np.zeros((len(new_ids), self.k), dtype=np.int64)])
+            neighbors[dirty] = query_neighbors(self.index, data[dirty], dirty, self.k)
+
+        # nodes whose incoming messages changed: touched nodes and both old and new targets of
+        # every edge whose source got a new neighbour list
+        dirty_old = dirty[dirty < old_n]
+        seeds = np.unique(np.concatenate([touched, old_neighbors[dirty_old].ravel(), neighbors[dirty].ravel()]))
+
+        self.x, self.neighbors = x, neighbors
+        self.user_ids = self.user_ids + list(new_ids)
+        for i, u in zip(new_rows, new_ids):
+            self.rows[u] = int(i)
+        edge_index = self.edge_index()
+
+        # outputs within num_layers hops downstream of a seed change, and computing them exactly
+        # needs their num_layers-hop upstream receptive field
+        affected = k_hop_subgraph(torch.from_numpy(seeds), self.num_layers, edge_index,
+                                  num_nodes=n, flow="target_to_source")[0]
+        subset, sub_edge_index, mapping, _ = k_hop_subgraph(affected, self.num_layers, edge_index,
+                                                           relabel_nodes=True, num_nodes=n)
+
+        refined = torch.cat([self.refined, self.refined.new_zeros(len(new_ids), self.refined.shape[1])])
+        if len(subset) > self.full_rebuild_ratio * n:
+            # receptive field covers most of the graph, a full pass is cheaper
+            refined = self._forward(self.x, edge_index)
+            affected = subset = torch.arange(n)
+        else:
+            refined[affected] = self._forward(self.x[subset.numpy()], sub_edge_index)[mapping]
+        self.refined = refined
+
+        self.version += 1
+        self.last_update = {"mode": "incremental", "version": self.version, "recomputed": len(affected),
+                            "subgraph": len(subset), "dirty_neighbor_lists": len(dirty)}
@@ -0,0 +1,167 @@
+from torch_geometric.data import Data
+from torch_geometric.nn.dense.linear import Linear as PygLinear
+from knn_graph import build_edge_index
+import torch.nn.functional as F
+import torch.nn as nn
+import numpy as np
+import copy
+import time
+import torch
+
+
+# Inference-optimized serving path for customGNN. optimize_model wraps a trained eager model
+# in an InferenceModel that GraphState can call like the original (model(data) -> float32):
+#   precision "fp32" (eager weights), "int8" (dynamic int8 quantization of the GATv2Conv
+#   linear layers) or "bf16" (CPU autocast)
+#   backend   "eager" or "compile" (torch.compile). TorchScript is not offered, torch.jit.script
+#             cannot compile this torch_geometric's GATv2Conv and would always fall back
+# Any step that fails falls back to the eager model. drift() compares the optimized outputs
+# with the eager refined embeddings on the same graph, so modes can be compared before one
+# is picked for production.
+
+PRECISIONS = ("fp32", "int8", "bf16")
+BACKENDS = ("eager", "compile")
+
+
+class GNNForward(nn.Module):
+    # customGNN.forward on plain tensors in eval mode (dropout is a no-op), so it can be
+    # compiled without the Data object
+    def __init__(self, model):
+        super().__init__()
+        self.conv1 = model.conv1
+        self.conv2 = model.conv2
+        self.conv3 = model.conv3
+        self.conv4 = model.conv4
+
+    def forward(self, x: torch.Tensor, edge_index: torch.Tensor) -> torch.Tensor:
+        x = F.elu(self.conv1(x, edge_index))
+        x = F.elu(self.conv2(x, edge_index))
+        x = F.elu(self.conv3(x, edge_index))
+        return self.conv4(x, edge_index)
+
+
+class InferenceModel(nn.Module):
+    def __init__(self, forward_fn, precision="fp32", backend="eager"):
+        super().__init__()
+        self.forward_fn = forward_fn
+        self.precision = precision
+        self.backend = backend
+
+    def forward(self, data):
+        with torch.no_grad():
+            if self.precision == "bf16":
+                with torch.autocast("cpu", dtype=torch.bfloat16):
+                    out = self.forward_fn(data.x, data.edge_index)
+            else:
+                out = self.forward_fn(data.x, data.edge_index)
+        return out.float()
+
+
+def _to_torch_linear(model):
+    # GATv2Conv uses torch_geometric's Linear, which quantize_dynamic does not recognise.
+    # swap each one for an nn.Linear with the same weights, keeping shared layers shared
+    # (share_weights=True makes lin_r the same module as lin_l)
+    swapped = {}
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if not isinstance(child, PygLinear):
+                continue
+            if id(child) not in swapped:
+                linear = nn.Linear(child.in_channels, child.out_channels, bias=child.bias is not None)
+                linear.weight.data.copy_(child.weight.data)
+                if child.bias is not None:
+                    linear.bias.data.copy_(child.bias.data)
+                swapped[id(child)] = linear
+            setattr(module, name, swapped[id(child)])
+    return model
+
+
+def set_threads(intra_op=None, inter_op=None):
+    """
+    sets torch's intra-op / inter-op thread counts, inter-op can only be changed before any
+    parallel work has run so a late call is ignored. returns the counts in effect
+    """
+    if intra_op:
+        torch.set_num_threads(int(intra_op))
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(int(inter_op))
+        except RuntimeError as e:
+            print("Could not set inter-op threads:", e)
+    return {"intra_op": torch.get_num_threads(), "inter_op": torch.get_num_interop_threads()}
+
+
+def optimize_model(model, precision="fp32", backend="eager"):
+    """
+    returns (InferenceModel, errors) for a trained customGNN, the eager model is not modified.
+    errors lists the steps that failed and fell back to eager
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision}, expected one of {PRECISIONS}")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}, expected one of {BACKENDS}")
+
+    errors = []
+    model = copy.deepcopy(model).eval()
+    if precision == "int8":
+        try:
+            model = torch.ao.quantization.quantize_dynamic(_to_torch_linear(model), {nn.Linear}, dtype=torch.qint8)
+        except Exception as e:
+            errors.append(f"int8: {e}")
+            precision = "fp32"
+
+    forward_fn = GNNForward(model).eval()
+    if backend == "compile":
+        try:
+            # graph sizes change with every sync, so compile for dynamic shapes
+            forward_fn = torch.compile(forward_fn, dynamic=True)
+        except Exception as e:
+            errors.append(f"compile: {e}")
+            backend = "eager"
+    return InferenceModel(forward_fn, precision, backend).eval(), errors
+
+
+def warmup_data(num_nodes=256, input_size=768, k=10, seed=0):
+    # random unit-norm features with their KNN graph, the same shape of input /run-gnn builds
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal((num_nodes, input_size)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return Data(x=torch.from_numpy(x), edge_index=build_edge_index(x, k=min(k, num_nodes - 1)))
+
+
+def _timed(model, data, repeats):
+    with torch.no_grad():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            out = model(data)
+    return out, (time.perf_counter() - start) / repeats * 1000
+
+
+def drift(eager_model, optimized_model, data, repeats=3):
+    """
+    runs both models on data and reports how far the optimized refined embeddings are from
+    the eager ones, plus the latency of each. the first optimized call is timed separately
+    since it includes compilation
+    """
+    start = time.perf_counter()
+    with torch.no_grad():
+        optimized_model(data)
+    first_call_ms = (time.perf_counter() - start) * 1000
+
+    reference, eager_ms = _timed(eager_model, data, repeats)
+    output, optimized_ms = _timed(optimized_model, data, repeats)
+    reference, output = reference.float(), output.float()
+
+    diff = (output - reference).abs()
+    cosine = F.cosine_similarity(output, reference, dim=1)
+    return {
+        "nodes": data.num_nodes,
+        "max_abs": diff.max().item(),
+        "mean_abs": diff.mean().item(),
+        "rel_l2": ((output - reference).norm() / reference.norm().clamp_min(1e-12)).item(),
+        "min_cosine": cosine.min().item(),
+        "mean_cosine": cosine.mean().item(),
+        "eager_ms": eager_ms,
+        "optimized_ms": optimized_ms,
+        "first_call_ms": first_call_ms,
+    }
@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import contextvars
+import threading
+import time
+import uuid
+
+
+# Background jobs for long-running work (grouping). A JobManager runs at most max_running
+# jobs at a time on its own threads and admits at most max_queued more; anything beyond that
+# is rejected with JobQueueFull instead of oversubscribing the machine. Jobs report progress
+# records (e.g. GA generation stats from the DEAP logbook) that callers can poll or stream.
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _plain(value):
+    # numpy scalars -> python, so progress records serialise as JSON
+    return value.item() if hasattr(value, "item") else value
+
+
+class Job:
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.progress = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    def report(self, record):
+        record = {key: _plain(value) for key, value in dict(record).items()}
+        record.setdefault("gen", len(self.progress))
+        record["elapsed"] = time.time() - (self.started_at or self.created_at)
+        self.progress.append(record)
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def summary(self, include_result=True):
+        summary = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+        }
+        if self.error is not None:
+            summary["error"] = self.error
+        if include_result and self.status == "done":
+            summary["result"] = self.result
+        return summary
+
+
+class JobManager:
+    def __init__(self, max_running=1, max_queued=4, keep_finished=100):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self.executor = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="job")
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def active(self):
+        return sum(1 for job in self.jobs.values() if not job.finished)
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """
+        queues fn(job, *args, **kwargs) and returns the Job, raises JobQueueFull when
+        max_running + max_queued jobs are already waiting or running
+        """
+        with self.lock:
+            if self.active() >= self.max_running + self.max_queued:
+                raise JobQueueFull(f"{self.active()} jobs already queued or running")
+            job = Job(kind)
+            self.jobs[job.id] = job
+            self._prune()
+            # in the submitter's context, so spans inside the job reach its request trace
+            job.future = self.executor.submit(contextvars.copy_context().run, self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "done"
+            return job.result
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            raise
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[: max(len(finished) - self.keep_finished, 0)]:
+            del self.jobs[job_id]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,262 @@
+from sklearn.preprocessing import normalize
+import numpy as np
+import argparse
+import time
+import torch
+
+try:
+    import hnswlib
+except ImportError:  # optional, only needed for HNSWIndex
+    hnswlib = None
+
+
+# Shared KNN graph construction for app.py and train.py.
+# An index is fit on the embeddings once and queried for the k most cosine-similar users;
+# build_edge_index turns the neighbour lists straight into a [2, N*k] edge_index tensor.
+#   ExactIndex    - blockwise brute force on normalised float32 rows, exact
+#   RPForestIndex - random-projection trees in NumPy with exact re-ranking of leaf candidates
+#   HNSWIndex     - hnswlib graph index (optional dependency)
+
+
+class ExactIndex:
+    def __init__(self, block_size=2048):
+        self.block_size = block_size
+
+    def fit(self, embeddings):
+        self.data = normalize(np.asarray(embeddings, dtype=np.float32))
+        return self
+
+    def update(self, rows, embeddings):
+        # overwrite existing rows and append new ones (rows == len(data), len(data) + 1, ...)
+        rows = np.asarray(rows, dtype=np.int64)
+        grow = int(rows.max()) + 1 - len(self.data) if len(rows) else 0
+        if grow > 0:
+            self.data = np.concatenate([self.data, np.zeros((grow, self.data.shape[1]), dtype=np.float32)])
+        self.data[rows] = normalize(np.asarray(embeddings, dtype=np.float32))
+        return self
+
+    def query(self, embeddings, k):
+        queries = normalize(np.asarray(embeddings, dtype=np.float32))
+        k = min(k, len(self.data))
+        out = np.empty((len(queries), k), dtype=np.int64)
+        for start in range(0, len(queries), self.block_size):
+            sims = queries[start:start + self.block_size] @ self.data.T
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1, kind="stable")
+            out[start:start + len(sims)] = np.take_along_axis(top, order, axis=1)
+        return out
+
+
+class RPForestIndex:
+    # Each tree splits its points at the median of a random projection until leaves hold at
+    # most leaf_size points. A query collects the members of its leaf in every tree and
+    # re-ranks them exactly, so more trees / bigger leaves trade speed for recall. Queries whose
+    # leaves hold fewer than k distinct points fall back to exact search.
+    def __init__(self, n_trees=8, leaf_size=64, block_size=128, seed=0):
+        self.n_trees = n_trees
+        self.leaf_size = leaf_size
+        self.block_size = block_size
+        self.seed = seed
+
+    def fit(self, embeddings):
+        self.data = normalize(np.asarray(embeddings, dtype=np.float32))
+        rng = np.random.default_rng(self.seed)
+        self.trees = [self._build_tree(rng) for _ in range(self.n_trees)]
+        return self
+
+    def _build_tree(self, rng):
+        n, d = self.data.shape
+        # node ids are assigned in creation order, stack holds (node id, member indices)
+        stack = [(0, np.arange(n))]
+        n_nodes = 1
+        nodes = {}
+        while stack:
+            node, members = stack.pop()
+            if len(members) <= self.leaf_size:
+                nodes[node] = (None, 0.0, (-1, -1), members)
+                continue
+            plane = rng.standard_normal(d).astype(np.float32)
+            proj = self.data[members] @ plane
+            threshold = np.median(proj)
+            left = proj <= threshold
+            if left.all() or not left.any():
+                # duplicate points, split arbitrarily
+                left = np.zeros(len(members), dtype=bool)
+                left[: len(members) // 2] = True
+            nodes[node] = (plane, threshold, (n_nodes, n_nodes + 1), None)
+            stack.append((n_nodes, members[left]))
+            stack.append((n_nodes + 1, members[~left]))
+            n_nodes += 2
+
+        hyperplanes = np.zeros((n_nodes, d), dtype=np.float32)
+        thresholds = np.zeros(n_nodes, dtype=np.float32)
+        children = np.full((n_nodes, 2), -1, dtype=np.int64)
+        leaves = np.full((n_nodes, self.leaf_size), -1, dtype=np.int64)
+        for node, (plane, threshold, kids, members) in nodes.items():
+            if members is None:
+                hyperplanes[node] = plane
+                thresholds[node] = threshold
+                children[node] = kids
+            else:
+                leaves[node, : len(members)] = members
+        return hyperplanes, thresholds, children, leaves
+
+    def _leaf_of(self, tree, queries):
+        hyperplanes, thresholds, children, _ = tree
+        node = np.zeros(len(queries), dtype=np.int64)
+        inner = children[node, 0] >= 0
+        while inner.any():
+            q = np.flatnonzero(inner)
+            proj = np.einsum("ij,ij->i", queries[q], hyperplanes[node[q]])
+            node[q] = children[node[q], (proj > thresholds[node[q]]).astype(np.int64)]
+            inner = children[node, 0] >= 0
+        return node
+
+    def query(self, embeddings, k):
+        queries = normalize(np.asarray(embeddings, dtype=np.float32))
+        k = min(k, len(self.data))
+        out = np.empty((len(queries), k), dtype=np.int64)
+        for start in range(0, len(queries), self.block_size):
+            block = queries[start:start + self.block_size]
+            # leaf members from every tree, duplicates across trees masked out
+            cands = np.concatenate([tree[3][self._leaf_of(tree, block)] for tree in self.trees], axis=1)
+            cands = np.sort(cands, axis=1)
+            cands[:, 1:][cands[:, 1:] == cands[:, :-1]] = -1
+            if cands.shape[1] < k:
+                cands = np.pad(cands, ((0, 0), (0, k - cands.shape[1])), constant_values=-1)
+
+            valid = cands >= 0
+            sims = np.matmul(self.data[np.where(valid, cands, 0)], block[:, :, None])[:, :, 0]
+            sims = np.where(valid, sims, -np.inf)
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            out[start:start + len(block)] = np.take_along_axis(cands, top, axis=1)
+
+            short = np.flatnonzero(valid.sum(axis=1) < k)
+            if len(short):
+                sims = block[short] @ self.data.T
+                top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+                order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1, kind="stable")
+                out[start + short] = np.take_along_axis(top, order, axis=1)
+        return out
+
+
+class HNSWIndex:
+    def __init__(self, M=16, ef_construction=200, ef=64, num_threads=-1, seed=0):
+        if hnswlib is None:
+            raise ImportError("HNSWIndex requires the hnswlib package (pip install hnswlib)")
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self.num_threads = num_threads
+        self.seed = seed
+
+    def fit(self, embeddings):
+        data = normalize(np.asarray(embeddings, dtype=np.float32))
+        self.index = hnswlib.Index(space="cosine", dim=data.shape[1])
+        self.index.init_index(max_elements=len(data), ef_construction=self.ef_construction,
+                              M=self.M, random_seed=self.seed)
+        self.index.add_items(data, np.arange(len(data)), num_threads=self.num_threads)
+        self.size = len(data)
+        return self
+
+    def query(self, embeddings, k):
+        k = min(k, self.size)
+        self.index.set_ef(max(self.ef, k))
+        labels, _ = self.index.knn_query(normalize(np.asarray(embeddings, dtype=np.float32)), k=k,
+                                         num_threads=self.num_threads)
+        return labels.astype(np.int64)
+
+
+INDEXES = {"exact": ExactIndex, "rp": RPForestIndex, "hnsw": HNSWIndex}
+
+
+def make_index(index="exact", **kwargs):
+    # index is a name from INDEXES or an already constructed index
+    if not isinstance(index, str):
+        return index
+    if index not in INDEXES:
+        raise ValueError(f"Unknown KNN index: {index}")
+    return INDEXES[index](**kwargs)
+
+
+def knn_neighbors(embeddings, k=10, index="exact", **kwargs):
+    """
+    returns an [N, k] array with the k nearest neighbours of every user, self excluded
+    """
+    embeddings = np.asarray(embeddings)
+    k = min(k, len(embeddings) - 1)
+    if k <= 0:
+        return np.zeros((len(embeddings), 0), dtype=np.int64)
+    index = make_index(index, **kwargs).fit(embeddings)
+    return query_neighbors(index, embeddings, np.arange(len(embeddings)), k)
+
+
+def query_neighbors(index, embeddings, rows, k):
+    # neighbours of the fitted rows `rows` (whose vectors are `embeddings`), self excluded
+    idx = index.query(embeddings, k + 1)
+    # drop self where it was returned, otherwise the furthest neighbour
+    is_self = idx == np.asarray(rows)[:, None]
+    order = np.argsort(is_self, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1)[:, :k]
+
+
+def build_edge_index(embeddings, k=10, index="exact", **kwargs):
+    """
+    directed edges (user, neighbour) for every user's k nearest neighbours as a [2, N*k] tensor
+    """
+    neighbors = knn_neighbors(embeddings, k=k, index=index, **kwargs)
+    src = np.repeat(np.arange(len(neighbors)), neighbors.shape[1])
+    return torch.from_numpy(np.stack([src, neighbors.ravel()]))
+
+
+def recall_at_k(approx, exact):
+    # fraction of the exact neighbours that the approximate index also returned
+    hits = sum(len(np.intersect1d(a, e)) for a, e in zip(approx, exact))
+    return hits / exact.size
+
+
+def benchmark_indexes(embeddings, k=10, indexes=None):
+    """
+    times every index on the embeddings and reports recall@k against exact search,
+    returns a list of {"index", "seconds", "recall"} rows
+    """
+    if indexes is None:
+        indexes = {"exact": {}, "rp": {}}
+        if hnswlib is not None:
+            indexes["hnsw"] = {}
+    start = time.perf_counter()
+    exact = knn_neighbors(embeddings, k=k, index="exact")
+    results = [{"index": "exact", "seconds": time.perf_counter() - start, "recall": 1.0}]
+    for name, kwargs in indexes.items():
+        if name == "exact":
+            continue
+        start = time.perf_counter()
+        approx = knn_neighbors(embeddings, k=k, index=name, **kwargs)
+        results.append({"index": name, "seconds": time.perf_counter() - start,
+                        "recall": recall_at_k(approx, exact)})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="KNN index speed/recall benchmark on synthetic embeddings")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--trees", type=int, default=8, help="RPForestIndex n_trees")
+    parser.add_argument("--leaf-size", type=int, default=64, help="RPForestIndex leaf_size")
+    parser.add_argument("--ef", type=int, default=64, help="HNSWIndex query ef")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((args.clusters, args.dim)).astype(np.float32)
+    embeddings = centers[rng.integers(0, args.clusters, args.users)] \
+        + 0.5 * rng.standard_normal((args.users, args.dim)).astype(np.float32)
+
+    indexes = {"rp": {"n_trees": args.trees, "leaf_size": args.leaf_size}}
+    if hnswlib is not None:
+        indexes["hnsw"] = {"ef": args.ef}
+    for row in benchmark_indexes(embeddings, k=args.k, indexes=indexes):
+        print(f"{row['index']:>6}  {row['seconds']:8.3f}s  recall@{args.k}={row['recall']:.4f}")
@@ -0,0 +1,181 @@
+from embedding_store import load_embeddings, parse_vectors, _rows
+from knn_graph import make_index, query_neighbors
+import numpy as np
+import torch
+
+
+# Neighbour lists for the user graph, computed where the embeddings live.
+#   PgvectorKNN  pushes the top-k search down to Postgres: one match_user_neighbors RPC per batch
+#                of query ids returns (query_id, neighbor_id, rank) rows, so only ids cross the
+#                wire, and features() fetches embeddings just for the users a request needs
+#   LocalKNN     the same interface over an in-memory snapshot with a knn_graph index (NumPy),
+#                the stand-in for tests and for databases without the function
+# neighbors(ids, k) returns every id's own top-k, neighbors(ids, k, incoming=True) the users whose
+# top-k contains the id. Messages flow along (user, neighbour) edges, so a user's refined embedding
+# depends on its incoming neighbours: neighborhood_graph() expands those hop by hop into the
+# num_layers-hop receptive field of a few users, and /run-gnn refines them on it with the same
+# result as a full-graph pass, without pulling the whole embedding table.
+# LocalSupabase(functions={"match_user_neighbors": match_user_neighbors_stub()}) runs
+# PgvectorKNN end to end without a database.
+
+# server side half of PgvectorKNN, created with its hnsw index by migrations/setup_embedding_functions.sql
+# incoming=true runs the top-k search of every user and keeps the lists that contain a query id,
+# so it costs a table scan per call whatever the batch size (PgvectorKNN sends bigger batches)
+MATCH_USER_NEIGHBORS_SQL = """
+create or replace function match_user_neighbors(query_ids bigint[], k int, incoming boolean default false)
+returns table (query_id bigint, neighbor_id bigint, rank int)
+language sql stable as $$
+  -- the k nearest users of each query id
+  select q.id, n.id, n.rank
+  from users q
+  cross join lateral (
+    select u.id, (row_number() over (order by u.embedding <=> q.embedding))::int as rank
+    from users u
+    where u.id <> q.id and u.embedding is not null
+    order by u.embedding <=> q.embedding
+    limit k
+  ) n
+  where not incoming and q.id = any(query_ids)
+  union all
+  -- the users whose k nearest contain a query id, rank is the query's place in that list
+  select n.id, q.id, n.rank
+  from users q
+  cross join lateral (
+    select u.id, (row_number() over (order by u.embedding <=> q.embedding))::int as rank
+    from users u
+    where u.id <> q.id and u.embedding is not null
+    order by u.embedding <=> q.embedding
+    limit k
+  ) n
+  where incoming and q.embedding is not null and n.id = any(query_ids)
+$$;
+"""
+
+
+class PgvectorKNN:
+    def __init__(self, client, table="users", id_column="id", column="embedding",
+                 function="match_user_neighbors", dim=768, batch_size=256, incoming_batch_size=4096,
+                 wire_format="text"):
+        self.client = client
+        self.table = table
+        self.id_column = id_column
+        self.column = column
+        self.function = function
+        self.dim = dim
+        self.batch_size = batch_size
+        self.incoming_batch_size = incoming_batch_size
+        self.wire_format = wire_format
+
+    def neighbors(self, user_ids, k, incoming=False):
+        # {user id: neighbour ids, nearest first}, or with incoming the ids of the users listing it,
+        # one round-trip per batch of users
+        user_ids = list(user_ids)
+        batch_size = self.incoming_batch_size if incoming else self.batch_size
+        out = {}
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            rows = _rows(self.client.rpc(self.function, {"query_ids": batch, "k": k, "incoming": incoming}).execute())
+            for row in sorted(rows, key=lambda row: row["rank"]):
+                out.setdefault(row["query_id"], []).append(row["neighbor_id"])
+            for u in batch:
+                out.setdefault(u, [])
+        return out
+
+    def features(self, user_ids):
+        # float32 [len(user_ids), dim] in user_ids order, one select per batch_size users
+        user_ids = list(user_ids)
+        rows = {u: i for i, u in enumerate(user_ids)}
+        out = np.empty((len(user_ids), self.dim), dtype=np.float32)
+        found = np.zeros(len(user_ids), dtype=bool)
+        for start in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[start:start + self.batch_size]
+            page = _rows(self.client.table(self.table).select(f"{self.id_column}, {self.column}")
+                         .in_(self.id_column, batch).execute())
+            page = [row for row in page if row.get(self.column) is not None]
+            vectors = parse_vectors([row[self.column] for row in page], self.dim, wire_format=self.wire_format)
+            for row, vector in zip(page, vectors):
+                out[rows[row[self.id_column]]] = vector
+                found[rows[row[self.id_column]]] = True
+        if not found.all():
+            missing = [u for u, ok in zip(user_ids, found) if not ok]
+            raise ValueError(f"No embedding for users: {missing[:10]}")
+        return out
+
+
+class LocalKNN:
+    def __init__(self, embeddings, user_ids, index="exact", **index_kwargs):
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.user_ids = list(user_ids)
+        self.rows = {u: i for i, u in enumerate(self.user_ids)}
+        self.index = make_index(index, **index_kwargs).fit(self.embeddings)
+        self.incoming = {}
+
+    @classmethod
+    def from_client(cls, client, table="users", id_column="id", column="embedding", dim=768,
+                    index="exact", **index_kwargs):
+        embeddings, user_ids = load_embeddings(client, table, id_column, column, dim)
+        return cls(embeddings, user_ids, index, **index_kwargs)
+
+    def neighbors(self, user_ids, k, incoming=False):
+        user_ids = [u for u in user_ids if u in self.rows]
+        k = min(k, len(self.user_ids) - 1)
+        if not user_ids or k <= 0:
+            return {u: [] for u in user_ids}
+        if incoming:
+            if k not in self.incoming:
+                # reverse of every user's list, computed once per k
+                lists = self.neighbors(self.user_ids, k)
+                reverse = {u: [] for u in self.user_ids}
+                for u, neighbors in lists.items():
+                    for v in neighbors:
+                        reverse[v].append(u)
+                self.incoming[k] = reverse
+            return {u: list(self.incoming[k][u]) for u in user_ids}
+        rows = np.array([self.rows[u] for u in user_ids], dtype=np.int64)
+        idx = query_neighbors(self.index, self.embeddings[rows], rows, k)
+        return {u: [self.user_ids[j] for j in row] for u, row in zip(user_ids, idx)}
+
+    def features(self, user_ids):
+        return self.embeddings[[self.rows[u] for u in user_ids]]
+
+
+def match_user_neighbors_stub(table="users", id_column="id", column="embedding", dim=768):
+    # MATCH_USER_NEIGHBORS_SQL for LocalSupabase, recomputed from the stub's table on every call
+    def match(client, query_ids, k, incoming=False):
+        local = LocalKNN.from_client(client, table, id_column, column, dim)
+        if incoming:
+            lists = local.neighbors(local.user_ids, k)
+            return [{"query_id": v, "neighbor_id": u, "rank": lists[u].index(v) + 1}
+                    for v, sources in local.neighbors(query_ids, k, incoming=True).items() for u in sources]
+        return [{"query_id": u, "neighbor_id": v, "rank": rank + 1}
+                for u, neighbors in local.neighbors(query_ids, k).items()
+                for rank, v in enumerate(neighbors)]
+    return match
+
+
+def neighborhood_graph(provider, user_ids, k=10, num_layers=4):
+    """
+    the num_layers-hop receptive field of user_ids, returns (node ids with user_ids first,
+    edge_index [2, E] of (user, neighbour) edges). every node closer than num_layers hops gets
+    all its incoming edges, so a num_layers-layer GNN on the subgraph gives user_ids the same
+    output as on the full graph
+    """
+    nodes = list(dict.fromkeys(user_ids))
+    rows = {u: i for i, u in enumerate(nodes)}
+    edges = []
+    frontier = nodes
+    for _ in range(num_layers):
+        next_frontier = []
+        for v, sources in provider.neighbors(frontier, k, incoming=True).items():
+            for u in sources:
+                if u not in rows:
+                    rows[u] = len(nodes)
+                    nodes.append(u)
+                    next_frontier.append(u)
+                edges.append((rows[u], rows[v]))
+        frontier = next_frontier
+        if not frontier:
+            break
+    edge_index = torch.tensor(edges, dtype=torch.long).reshape(-1, 2).t().contiguous()
+    return nodes, edge_index
+
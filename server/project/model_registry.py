@@ -0,0 +1,90 @@
+from models import customGNN
+import shutil
+import json
+import time
+import os
+import torch
+
+
+# Versioned customGNN checkpoints shared by train.py and the server.
+#   directory/v0001/model.pth   state_dict
+#   directory/v0001/meta.json   {"version", "created_at", "input_size", "hidden_size", "output_size",
+#                                "embedding_model", "training_loss", ...}
+#   directory/LATEST            version the server should serve
+# A version directory is written under a temp name and renamed into place, LATEST is replaced
+# last, so a reader never sees a half-written checkpoint.
+
+
+class ModelRegistry:
+    def __init__(self, directory="models"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    def versions(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith("v") and os.path.exists(self._path(name, "meta.json")))
+
+    def latest(self):
+        # version in LATEST, or the newest version directory, None for an empty registry
+        try:
+            with open(self._path("LATEST")) as f:
+                version = f.read().strip()
+            if version in self.versions():
+                return version
+        except FileNotFoundError:
+            pass
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def metadata(self, version):
+        with open(self._path(version, "meta.json")) as f:
+            return json.load(f)
+
+    def register(self, state_dict, metadata, promote=True):
+        """
+        saves a new version and returns its name, promote makes it the one LATEST points to
+        """
+        tmp = self._path(f".tmp-{os.getpid()}-{time.time_ns()}")
+        os.makedirs(tmp)
+        torch.save(state_dict, os.path.join(tmp, "model.pth"))
+        while True:
+            versions = self.versions()
+            version = f"v{int(versions[-1][1:]) + 1 if versions else 1:04d}"
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump({**metadata, "version": version, "created_at": time.time()}, f)
+            try:
+                # fails if another writer took this version first, then try the next one
+                os.rename(tmp, self._path(version))
+                break
+            except OSError:
+                if not os.path.exists(self._path(version)):
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    raise
+        if promote:
+            self.promote(version)
+        return version
+
+    def promote(self, version):
+        if version not in self.versions():
+            raise ValueError(f"Unknown model version: {version}")
+        tmp = self._path(f"LATEST.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            f.write(version)
+        os.replace(tmp, self._path("LATEST"))
+
+    def load(self, version=None, device="cpu"):
+        """
+        builds the customGNN of a version (latest when None) in eval mode, returns (model, metadata)
+        """
+        version = version or self.latest()
+        if version is None:
+            raise FileNotFoundError(f"No model versions in {self.directory}")
+        meta = self.metadata(version)
+        model = customGNN(input_size=meta.get("input_size", 768), hidden_size=meta.get("hidden_size", 512),
+                          output_size=meta.get("output_size", 768)).to(device)
+        model.load_state_dict(torch.load(self._path(version, "model.pth"), map_location=device))
+        model.eval()
+        return model, meta
@@ -5,10 +5,17 @@ from torch_geometric.nn import GATv2Conv
 from transformers import pipeline
 import torch.nn.functional as F
 from fastapi import HTTPException
-from sklearn.metrics.pairwise import cosine_similarity
+from similarity import DenseSimilarity, build_similarity
+from knn_graph import knn_neighbors
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import normalize
 from deap import base, creator, tools, algorithms
+from multiprocessing import get_all_start_methods, get_context, shared_memory
+from metrics import REGISTRY, span
 import numpy as np
 import random
+import time
 import torch
 
 
@@ -68,13 +75,26 @@ class PSYCHBERT:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error during classification: {e}")
 
+    def classify_batch(self, texts, batch_size=16):
+        # Classify many texts in padded, truncated batches, one classify_personality-style result per text.
+        try:
+            results = self.psychbert_classifier(list(texts), batch_size=batch_size, padding=True, truncation=True)
+            return [{"personality_results": r if isinstance(r, list) else [r]} for r in results]
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error during classification: {e}")
+
 
 
 # GeneticAlgorithm: Uses a genetic algorithm to partition users into groups
 # based on their refined embeddings. The goal is to maximize intra-group cohesion.
 
+GENERATION_SECONDS = REGISTRY.histogram("mindsync_grouping_generation_seconds",
+                                        "Time per GA generation / partition search sweep", labels=("engine",))
+BEST_FITNESS = REGISTRY.gauge("mindsync_grouping_best_fitness",
+                              "Best fitness of the latest GA generation / partition search sweep", labels=("engine",))
+
 class GeneticAlgorithm:
-    def __init__(self, NUsers, embeddings, embedding_size=768, minK=3, maxK=5):
+    def __init__(self, NUsers, embeddings, embedding_size=768, minK=3, maxK=5, similarity="auto"):
         self.N_USERS = NUsers  # Number of users
         self.embedding_size = embedding_size
         self.MIN_GROUP_SIZE = minK  # dynamic range for group size
@@ -82,8 +102,9 @@ class GeneticAlgorithm:
         
         # estimate number of groups based on average desired group size
         self.NUM_GROUPS = int(np.ceil(NUsers / ((minK + maxK) / 2)))
-        #  cosine similarity matrix for all users
-        self.s = cosine_similarity(embeddings)
+        #  cosine similarity for all users, a dense matrix or a linear-memory backend (see similarity.py)
+        with span("grouping_similarity"):
+            self.s = build_similarity(embeddings, similarity)
         
         # DEAP genetic algorithm types.
         # Avoid duplicate creation if already exists.
@@ -146,29 +167,437 @@ class GeneticAlgorithm:
         
         fitness = total_score - penalty
         return (fitness,)
+
+    def _pair_sums(self, keys, users, n_keys):
+        # Scatter-add of s[i, j] over every ordered pair (i != j) that shares a key.
+        # keys are group ids (offset per individual when scoring a batch), users are row indices into self.s.
+        return self.s.pair_sums(keys, users, n_keys)
+
+    def _fitness_from_groups(self, sums, sizes):
+        # Same scoring as evaluate_individual, vectorised over group ids (last axis).
+        pairs = sizes * (sizes - 1)
+        score = np.divide(sums, pairs, out=np.zeros_like(sums, dtype=float), where=sizes > 1)
+        too_small = np.where(sizes > 0, np.maximum(self.MIN_GROUP_SIZE - sizes, 0), 0) * 0.1
+        too_large = np.maximum(sizes - self.MAX_GROUP_SIZE, 0) * 0.1
+        return score.sum(axis=-1) - (too_small + too_large).sum(axis=-1)
+
+    def evaluate_population(self, population):
+        """
+        scores a whole population at once, returns a list of fitness tuples in the same order.
+        individuals that carry a group cache from a previous evaluation (clones made by
+        crossover/mutation) only rescore the groups whose membership changed.
+        """
+        fitnesses = [None] * len(population)
+        full = []
+        for i, individual in enumerate(population):
+            fit = self._evaluate_delta(individual)
+            if fit is None:
+                full.append(i)
+            else:
+                fitnesses[i] = fit
+
+        if full:
+            G = self.NUM_GROUPS
+            assign = np.asarray([population[i] for i in full], dtype=np.int64)
+            keys = (assign + (np.arange(len(full)) * G)[:, None]).ravel()
+            users = np.tile(np.arange(self.N_USERS), len(full))
+            sums = self._pair_sums(keys, users, len(full) * G).reshape(len(full), G)
+            sizes = np.bincount(keys, minlength=len(full) * G).reshape(len(full), G)
+            values = self._fitness_from_groups(sums, sizes)
+            for row, i in enumerate(full):
+                population[i].group_cache = (assign[row].copy(), sums[row].copy(), sizes[row].copy())
+                fitnesses[i] = (float(values[row]),)
+        return fitnesses
+
+    def _evaluate_delta(self, individual):
+        # Delta mode: rescore only the groups touched since the cached assignment.
+        # Returns None when there is no cache or too much changed for a delta to pay off.
+        cache = getattr(individual, "group_cache", None)
+        if cache is None:
+            return None
+        old_assign, sums, sizes = cache
+        assign = np.asarray(individual, dtype=np.int64)
+        changed = np.flatnonzero(assign != old_assign)
+        affected = np.unique(np.concatenate([old_assign[changed], assign[changed]]))
+        if len(affected) > self.NUM_GROUPS // 2:
+            return None
+
+        sums = sums.copy()
+        sizes = sizes + np.bincount(assign[changed], minlength=self.NUM_GROUPS) \
+            - np.bincount(old_assign[changed], minlength=self.NUM_GROUPS)
+        if len(affected):
+            members = np.flatnonzero(np.isin(assign, affected))
+            sums[affected] = 0.0
+            sums += self._pair_sums(assign[members], members, self.NUM_GROUPS)
+
+        individual.group_cache = (assign, sums, sizes)
+        return (float(self._fitness_from_groups(sums, sizes)),)
+
+    def _batched_map(self, func, individuals):
+        # toolbox.map replacement: population-wide evaluation goes through evaluate_population,
+        # anything else is mapped serially like DEAP's default.
+        individuals = list(individuals)
+        if func is self.toolbox.evaluate:
+            return self.evaluate_population(individuals)
+        return list(map(func, individuals))
     
-    def run_genetic_algorithm(self, pop_size=50, n_gen=40):
+    def run_genetic_algorithm(self, pop_size=50, n_gen=40, batched=True, n_workers=None, seed=None,
+                              on_generation=None, verbose=True):
         """
          genetic algorithm to tweak group assignments.
         returns the best individual group assignments
+        batched=True scores each generation with evaluate_population instead of one
+        evaluate_individual call per individual, fitness values are the same either way.
+        n_workers > 1 spreads evaluation over a process pool that reads the similarity matrix
+        from shared memory. with a fixed seed serial and parallel runs return the same result.
+        on_generation(record) is called with each generation's statistics as they are compiled,
+        every record (and logbook entry) also carries the generation's wall time in "seconds".
+        verbose=False keeps DEAP from printing the logbook.
         """
-        population = self.toolbox.population(n=pop_size)
-        
-       
-        stats = tools.Statistics(lambda ind: ind.fitness.values)
-        stats.register("avg", np.mean)
-        stats.register("max", np.max)
-        
-        #  GA using eaSimple.
-        population, logbook = algorithms.eaSimple(
-            population,
-            self.toolbox,
-            cxpb=0.5,  
-            mutpb=0.2, 
-            ngen=n_gen,
-            stats=stats,
-            verbose=True
-        )
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+
+        pool, shm = None, None
+        if n_workers is not None and n_workers > 1:
+            pool, shm = self._start_pool(n_workers)
+            self.toolbox.register("map", lambda func, individuals: self._pool_map(pool, n_workers, func, individuals, batched))
+        elif batched:
+            self.toolbox.register("map", self._batched_map)
+        else:
+            self.toolbox.register("map", map)
+
+        try:
+            population = self.toolbox.population(n=pop_size)
+            
+           
+            stats = tools.Statistics(lambda ind: ind.fitness.values)
+            stats.register("avg", np.mean)
+            stats.register("max", np.max)
+            # eaSimple compiles the stats once per generation, right after evaluating it
+            compile_stats = stats.compile
+            last = [time.perf_counter()]
+            def compile_and_report(population):
+                record = compile_stats(population)
+                now = time.perf_counter()
+                record["seconds"] = now - last[0]
+                last[0] = now
+                GENERATION_SECONDS.observe(record["seconds"], engine="ga")
+                BEST_FITNESS.set(float(record["max"]), engine="ga")
+                if on_generation is not None:
+                    on_generation(record)
+                return record
+            stats.compile = compile_and_report
+            
+            #  GA using eaSimple.
+            with span("grouping_evolve"):
+                population, logbook = algorithms.eaSimple(
+                    population,
+                    self.toolbox,
+                    cxpb=0.5,  
+                    mutpb=0.2, 
+                    ngen=n_gen,
+                    stats=stats,
+                    verbose=verbose
+                )
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
         
         best_ind = tools.selBest(population, k=1)[0]
         return best_ind, logbook
+
+    def _start_pool(self, n_workers):
+        # Copy a dense similarity matrix into shared memory once; workers map it instead of
+        # receiving a pickled copy with every task. Linear-memory backends are small enough
+        # to be handed to each worker once at startup.
+        shm, backend, shape, dtype = None, self.s, None, None
+        if isinstance(self.s, DenseSimilarity):
+            s = np.ascontiguousarray(self.s.matrix)
+            shm = shared_memory.SharedMemory(create=True, size=max(s.nbytes, 1))
+            np.ndarray(s.shape, dtype=s.dtype, buffer=shm.buf)[:] = s
+            backend, shape, dtype = None, s.shape, s.dtype.str
+        # workers come from a forkserver (spawn where there is none), never a fork of this process:
+        # inside the server it already runs torch and executor threads, and forking those can deadlock
+        if "forkserver" in get_all_start_methods():
+            context = get_context("forkserver")
+            # the forkserver imports this module once, later pools fork from it without re-importing torch
+            context.set_forkserver_preload([__name__])
+        else:
+            context = get_context("spawn")
+        pool = context.Pool(
+            processes=n_workers,
+            initializer=_init_ga_worker,
+            initargs=(shm.name if shm else None, shape, dtype, backend, self.N_USERS, self.NUM_GROUPS,
+                      self.MIN_GROUP_SIZE, self.MAX_GROUP_SIZE),
+        )
+        return pool, shm
+
+    def _pool_map(self, pool, n_workers, func, individuals, batched):
+        # Pool-backed toolbox.map. Individuals are sent as (assignment, group cache) pairs and
+        # the updated caches come back with the fitness so delta evaluation keeps working.
+        individuals = list(individuals)
+        if func is not self.toolbox.evaluate:
+            return pool.map(func, individuals)
+        if not individuals:
+            return []
+
+        payload = [(list(ind), getattr(ind, "group_cache", None)) for ind in individuals]
+        chunk = int(np.ceil(len(payload) / n_workers))
+        chunks = [payload[i:i + chunk] for i in range(0, len(payload), chunk)]
+        results = [r for part in pool.map(_evaluate_ga_chunk, [(c, batched) for c in chunks]) for r in part]
+
+        fitnesses = []
+        for ind, (fit, cache) in zip(individuals, results):
+            if cache is not None:
+                ind.group_cache = cache
+            fitnesses.append(fit)
+        return fitnesses
+
+
+# PartitionSearch: constraint-aware alternative to the GA. Starts from a balanced k-means
+# partition where every group already sits inside minK..maxK, then polishes it with
+# size-preserving swap/move local search over each user's nearest neighbours' groups.
+# Scores with the same fitness as GeneticAlgorithm so both engines can be compared directly.
+
+class PartitionSearch(GeneticAlgorithm):
+    def __init__(self, NUsers, embeddings, embedding_size=768, minK=3, maxK=5, n_neighbors=10, similarity="auto",
+                 knn_index="exact"):
+        super().__init__(NUsers, embeddings, embedding_size=embedding_size, minK=minK, maxK=maxK,
+                         similarity=similarity)
+        self.embeddings = normalize(np.asarray(embeddings, dtype=float))
+        self.n_neighbors = max(min(n_neighbors, NUsers - 1), 0)
+        self.knn_index = knn_index
+
+        # pick a group count for which every group can be kept inside minK..maxK
+        low = int(np.ceil(NUsers / maxK))
+        high = NUsers // minK
+        self.NUM_GROUPS = min(max(self.NUM_GROUPS, low), high) if low <= high else 1
+        self.toolbox.register("attr_group", random.randint, 0, self.NUM_GROUPS - 1)
+        self.toolbox.register("mutate", tools.mutUniformInt, low=0, up=self.NUM_GROUPS - 1, indpb=0.1)
+
+    def seed_assignment(self, seed=None):
+        # balanced k-means: users take their nearest centroid that still has capacity,
+        # most confident users first, so group sizes are exactly the target sizes
+        N, G = self.N_USERS, self.NUM_GROUPS
+        if G == 1:
+            return np.zeros(N, dtype=np.int64)
+        targets = np.full(G, N // G)
+        targets[:N % G] += 1
+
+        if N <= 20000:
+            km = KMeans(n_clusters=G, n_init=1, max_iter=50, random_state=seed)
+        else:
+            km = MiniBatchKMeans(n_clusters=G, n_init=1, batch_size=4096, random_state=seed)
+        labels = km.fit_predict(self.embeddings)
+        centers = normalize(km.cluster_centers_)
+
+        # bigger clusters get the bigger targets
+        capacity = np.empty(G, dtype=np.int64)
+        capacity[np.argsort(-np.bincount(labels, minlength=G), kind="stable")] = targets
+
+        nbrs = NearestNeighbors(n_neighbors=min(G, 8)).fit(centers)
+        dist, cands = nbrs.kneighbors(self.embeddings)
+        assignment = np.full(N, -1, dtype=np.int64)
+        for i in np.argsort(dist[:, 0], kind="stable"):
+            for c in cands[i]:
+                if capacity[c] > 0:
+                    assignment[i] = c
+                    capacity[c] -= 1
+                    break
+        for i in np.flatnonzero(assignment < 0):
+            open_groups = np.flatnonzero(capacity > 0)
+            c = open_groups[np.argmax(centers[open_groups] @ self.embeddings[i])]
+            assignment[i] = c
+            capacity[c] -= 1
+        return assignment
+
+    def _members(self, assignment):
+        # G x maxsize matrix of member indices, padded with -1
+        order = np.argsort(assignment, kind="stable")
+        sizes = np.bincount(assignment, minlength=self.NUM_GROUPS)
+        starts = np.cumsum(sizes) - sizes
+        width = max(int(sizes.max()), 1)
+        members = np.full((self.NUM_GROUPS, width), -1, dtype=np.int64)
+        members[assignment[order], np.arange(len(order)) - starts[assignment[order]]] = order
+        return members
+
+    def _affinity(self, users, groups, members):
+        # sum of s[u, m] over the members m of each paired group, excluding u itself
+        mem = members[groups]
+        valid = (mem >= 0) & (mem != users[:, None])
+        values = self.s[users[:, None], np.where(valid, mem, 0)]
+        return np.where(valid, values, 0.0).sum(axis=1)
+
+    def _group_score(self, sums, sizes):
+        pairs = sizes * (sizes - 1)
+        return np.divide(sums, pairs, out=np.zeros_like(sums, dtype=float), where=sizes > 1)
+
+    def _candidate_moves(self, assignment, sums, sizes, neighbors):
+        # best improving move or swap for every (user, neighbouring group) pair,
+        # returns (gain, user, group, partner) arrays with partner -1 for a plain move
+        N = self.N_USERS
+        members = self._members(assignment)
+        own = self._affinity(np.arange(N), assignment, members)
+
+        groups = assignment[neighbors]
+        users = np.repeat(np.arange(N), groups.shape[1])
+        groups = groups.ravel()
+        keep = groups != assignment[users]
+        pairs = np.unique(users[keep] * self.NUM_GROUPS + groups[keep])
+        users, groups = pairs // self.NUM_GROUPS, pairs % self.NUM_GROUPS
+        if len(users) == 0:
+            return np.zeros(0), users, groups, users
+
+        home = assignment[users]
+        n_home, n_dest = sizes[home], sizes[groups]
+        base = self._group_score(sums[home], n_home) + self._group_score(sums[groups], n_dest)
+        aff = self._affinity(users, groups, members)
+
+        # move: user leaves home for the destination group, both stay inside minK..maxK
+        move_gain = self._group_score(sums[home] - 2 * own[users], n_home - 1) \
+            + self._group_score(sums[groups] + 2 * aff, n_dest + 1) - base
+        move_ok = (n_home - 1 >= self.MIN_GROUP_SIZE) & (n_dest + 1 <= self.MAX_GROUP_SIZE)
+        move_gain = np.where(move_ok, move_gain, -np.inf)
+
+        # swap: user trades places with a member of the destination group, sizes unchanged
+        partners = members[groups]
+        valid = partners >= 0
+        p = np.where(valid, partners, 0)
+        W = partners.shape[1]
+        s_up = self.s[users[:, None], p]
+        partner_home = self._affinity(p.ravel(), np.repeat(home, W), members).reshape(p.shape)
+        home_sum = sums[home][:, None] - 2 * own[users][:, None] + 2 * (partner_home - s_up)
+        dest_sum = sums[groups][:, None] - 2 * own[p] + 2 * (aff[:, None] - s_up)
+        swap_gain = self._group_score(home_sum, n_home[:, None]) \
+            + self._group_score(dest_sum, n_dest[:, None]) - base[:, None]
+        swap_gain = np.where(valid, swap_gain, -np.inf)
+        best_swap = np.argmax(swap_gain, axis=1)
+        swap_best = swap_gain[np.arange(len(users)), best_swap]
+
+        use_swap = swap_best > move_gain
+        gain = np.where(use_swap, swap_best, move_gain)
+        partner = np.where(use_swap, partners[np.arange(len(users)), best_swap], -1)
+        return gain, users, groups, partner
+
+    def run_partition_search(self, max_iters=100, patience=3, tol=1e-6, seed=None, on_generation=None, verbose=True):
+        """
+        seeds a feasible partition and improves it with swap/move local search.
+        stops when a sweep finds no improving move, after max_iters sweeps, or when the
+        fitness gained over the last `patience` sweeps drops below tol.
+        returns (best assignment, logbook) like run_genetic_algorithm.
+        on_generation(record) is called with each sweep's logbook record, which includes the
+        sweep's wall time in "seconds". verbose=False skips printing the logbook.
+        """
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+
+        N, G = self.N_USERS, self.NUM_GROUPS
+        start = time.perf_counter()
+        with span("grouping_seed"):
+            assignment = self.seed_assignment(seed=seed)
+            neighbors = knn_neighbors(self.embeddings, k=self.n_neighbors, index=self.knn_index)
+
+        logbook = tools.Logbook()
+        logbook.header = ["gen", "nevals", "moves", "max", "seconds"]
+        sums = self._pair_sums(assignment, np.arange(N), G)
+        sizes = np.bincount(assignment, minlength=G)
+        history = [float(self._fitness_from_groups(sums, sizes))]
+        logbook.record(gen=0, nevals=0, moves=0, max=history[-1], seconds=time.perf_counter() - start)
+        BEST_FITNESS.set(history[-1], engine="partition")
+        if verbose:
+            print(logbook.stream)
+        if on_generation is not None:
+            on_generation(logbook[-1])
+
+        for it in range(1, max_iters + 1):
+            start = time.perf_counter()
+            gain, users, groups, partners = self._candidate_moves(assignment, sums, sizes, neighbors)
+            improving = np.flatnonzero(gain > tol)
+            order = improving[np.argsort(-gain[improving], kind="stable")]
+
+            # apply the best moves whose groups were not touched earlier in this sweep,
+            # so every applied gain is exact
+            touched = np.zeros(G, dtype=bool)
+            moves = 0
+            for k in order:
+                u, c, v = users[k], groups[k], partners[k]
+                a = assignment[u]
+                if touched[a] or touched[c]:
+                    continue
+                assignment[u] = c
+                if v >= 0:
+                    assignment[v] = a
+                touched[a] = touched[c] = True
+                moves += 1
+
+            sums = self._pair_sums(assignment, np.arange(N), G)
+            sizes = np.bincount(assignment, minlength=G)
+            history.append(float(self._fitness_from_groups(sums, sizes)))
+            seconds = time.perf_counter() - start
+            logbook.record(gen=it, nevals=len(users), moves=moves, max=history[-1], seconds=seconds)
+            GENERATION_SECONDS.observe(seconds, engine="partition")
+            BEST_FITNESS.set(history[-1], engine="partition")
+            if verbose:
+                print(logbook.stream)
+            if on_generation is not None:
+                on_generation(logbook[-1])
+
+            if moves == 0:
+                break
+            if len(history) > patience and history[-1] - history[-1 - patience] < tol:
+                break
+
+        best_ind = creator.Individual(assignment.tolist())
+        best_ind.fitness.values = (history[-1],)
+        return best_ind, logbook
+
+
+# Process-pool workers for GeneticAlgorithm. Each worker attaches to the shared similarity
+# matrix (or receives the linear-memory backend) once in the pool initializer and keeps a
+# scoring-only GeneticAlgorithm around.
+
+_worker_ga = None
+_worker_shm = None
+
+
+class _PooledIndividual(list):
+    # list that can carry a group_cache attribute inside a worker
+    pass
+
+
+def _init_ga_worker(shm_name, shape, dtype, backend, n_users, num_groups, min_k, max_k):
+    global _worker_ga, _worker_shm
+    if shm_name is not None:
+        # workers share the parent's resource tracker, the parent unlinks the segment when the run ends
+        _worker_shm = shared_memory.SharedMemory(name=shm_name)
+        backend = DenseSimilarity(matrix=np.ndarray(shape, dtype=np.dtype(dtype), buffer=_worker_shm.buf))
+
+    ga = GeneticAlgorithm.__new__(GeneticAlgorithm)
+    ga.N_USERS = n_users
+    ga.NUM_GROUPS = num_groups
+    ga.MIN_GROUP_SIZE = min_k
+    ga.MAX_GROUP_SIZE = max_k
+    ga.s = backend
+    _worker_ga = ga
+
+
+def _evaluate_ga_chunk(args):
+    chunk, batched = args
+    individuals = []
+    for assignment, cache in chunk:
+        ind = _PooledIndividual(assignment)
+        if cache is not None:
+            ind.group_cache = cache
+        individuals.append(ind)
+
+    if batched:
+        fitnesses = _worker_ga.evaluate_population(individuals)
+    else:
+        fitnesses = [_worker_ga.evaluate_individual(ind) for ind in individuals]
+    return [(fit, getattr(ind, "group_cache", None)) for fit, ind in zip(fitnesses, individuals)]
@@ -0,0 +1,171 @@
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+import scipy.sparse as sp
+import numpy as np
+
+
+# Similarity backends for the grouping engines.
+# Every backend supports s[rows, cols] with broadcastable integer index arrays (so
+# s[np.ix_(idx, idx)] works like on a plain matrix) and pair_sums(), the scatter-add of
+# s[i, j] over ordered pairs i != j sharing a key that the batched fitness is built on.
+#   DenseSimilarity     - full N x N cosine matrix, exact, O(N^2) memory (the original behaviour)
+#   EmbeddingSimilarity - normalised embeddings only, exact, O(N * d) memory
+#   TopKSimilarity      - top-k neighbours per user as sorted (row, col) pair keys and values looked
+#                         up by binary search, built blockwise, O(N * k) memory,
+#                         pairs outside the neighbour lists count as 0
+
+
+def enumerate_pair_sums(s, keys, users, n_keys):
+    # Scatter-add of s[i, j] over every ordered pair (i != j) that shares a key.
+    # keys are group ids (offset per individual when scoring a batch), users are row indices into s.
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    sorted_users = users[order]
+    counts = np.bincount(sorted_keys, minlength=n_keys)
+    starts = np.cumsum(counts) - counts
+
+    # each element is paired with every member of its own group (including itself)
+    reps = counts[sorted_keys]
+    left = np.repeat(np.arange(len(sorted_keys)), reps)
+    local = np.arange(reps.sum()) - np.repeat(np.cumsum(reps) - reps, reps)
+    right = np.repeat(starts[sorted_keys], reps) + local
+    off_diag = left != right
+    left, right = left[off_diag], right[off_diag]
+
+    values = s[sorted_users[left], sorted_users[right]]
+    return np.bincount(sorted_keys[left], weights=values, minlength=n_keys)
+
+
+class DenseSimilarity:
+    def __init__(self, embeddings=None, matrix=None):
+        self.matrix = cosine_similarity(embeddings) if matrix is None else matrix
+        self.n = self.matrix.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    def __getitem__(self, key):
+        return self.matrix[key]
+
+    def pair_sums(self, keys, users, n_keys):
+        return enumerate_pair_sums(self.matrix, keys, users, n_keys)
+
+
+class EmbeddingSimilarity:
+    # cos(i, j) = e_i . e_j on L2-normalised rows, and the ordered-pair sum of a group is
+    # |sum_i e_i|^2 - sum_i |e_i|^2, so group sums never need pairwise values at all.
+    def __init__(self, embeddings, dtype=np.float32, block_size=8192):
+        self.embeddings = normalize(np.asarray(embeddings, dtype=dtype))
+        self.sq_norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings, dtype=np.float64)
+        self.n = self.embeddings.shape[0]
+        self.block_size = block_size
+
+    @property
+    def nbytes(self):
+        return self.embeddings.nbytes + self.sq_norms.nbytes
+
+    def __getitem__(self, key):
+        rows, cols = np.broadcast_arrays(*key)
+        flat_rows, flat_cols = rows.ravel(), cols.ravel()
+        out = np.empty(len(flat_rows), dtype=np.float64)
+        for start in range(0, len(flat_rows), self.block_size):
+            stop = start + self.block_size
+            out[start:stop] = np.einsum(
+                "ij,ij->i",
+                self.embeddings[flat_rows[start:stop]],
+                self.embeddings[flat_cols[start:stop]],
+                dtype=np.float64,
+            )
+        return out.reshape(rows.shape)
+
+    def pair_sums(self, keys, users, n_keys):
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        sorted_users = users[order]
+        sums = np.zeros(n_keys)
+        sums -= np.bincount(sorted_keys, weights=self.sq_norms[sorted_users], minlength=n_keys)
+
+        # group vector sums, a bounded range of keys at a time
+        d = self.embeddings.shape[1]
+        keys_per_block = max(1, (self.block_size * 64) // d)
+        for k0 in range(0, n_keys, keys_per_block):
+            k1 = min(k0 + keys_per_block, n_keys)
+            lo, hi = np.searchsorted(sorted_keys, [k0, k1])
+            if lo == hi:
+                continue
+            one_hot = sp.csr_matrix(
+                (np.ones(hi - lo), (sorted_keys[lo:hi] - k0, np.arange(hi - lo))),
+                shape=(k1 - k0, hi - lo),
+            )
+            vectors = one_hot @ self.embeddings[sorted_users[lo:hi]].astype(np.float64)
+            sums[k0:k1] += np.einsum("ij,ij->i", vectors, vectors)
+        return sums
+
+
+class TopKSimilarity:
+    # Only the k most similar users of every user are kept (symmetrised, so a pair is stored
+    # when either side has the other in its top-k). Computed in float32 row blocks, so the
+    # full N x N matrix never exists.
+    def __init__(self, embeddings, k=50, block_size=1024, dtype=np.float32):
+        emb = normalize(np.asarray(embeddings, dtype=dtype))
+        n = emb.shape[0]
+        k = max(min(k, n - 1), 0)
+        self.n, self.k = n, k
+
+        rows, cols, vals = [], [], []
+        for start in range(0, n, block_size):
+            block = emb[start:start + block_size] @ emb.T
+            local = np.arange(block.shape[0])
+            block[local, start + local] = -np.inf  # drop self-similarity
+            if k == 0:
+                continue
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            rows.append(np.repeat(start + local, k))
+            cols.append(top.ravel())
+            vals.append(block[local[:, None], top].ravel())
+
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+        vals = np.concatenate(vals) if vals else np.zeros(0, dtype=dtype)
+
+        # union of both directions, sorted by (row, col) for binary-search lookups, the only copy
+        # of the pairs
+        pair_keys = np.concatenate([rows * n + cols, cols * n + rows])
+        self._keys, first = np.unique(pair_keys, return_index=True)
+        self._values = np.concatenate([vals, vals])[first]
+
+    @property
+    def nbytes(self):
+        return self._keys.nbytes + self._values.nbytes
+
+    def __getitem__(self, key):
+        rows, cols = np.broadcast_arrays(*key)
+        if len(self._keys) == 0:
+            return np.zeros(rows.shape)
+        lookup = rows.astype(np.int64) * self.n + cols
+        pos = np.minimum(np.searchsorted(self._keys, lookup), len(self._keys) - 1)
+        found = self._keys[pos] == lookup
+        return np.where(found, self._values[pos], 0.0).astype(np.float64)
+
+    def pair_sums(self, keys, users, n_keys):
+        return enumerate_pair_sums(self, keys, users, n_keys)
+
+
+def build_similarity(embeddings, backend="auto", **kwargs):
+    """
+    returns a similarity backend for the embeddings.
+    backend is "dense", "embedding", "topk", an already built backend, or "auto"
+    (dense up to 10k users where the matrix is still small, on-demand embedding sums above).
+    """
+    if not isinstance(backend, str):
+        return backend
+    if backend == "auto":
+        backend = "dense" if len(embeddings) <= 10000 else "embedding"
+    if backend == "dense":
+        return DenseSimilarity(embeddings, **kwargs)
+    if backend == "embedding":
+        return EmbeddingSimilarity(embeddings, **kwargs)
+    if backend == "topk":
+        return TopKSimilarity(embeddings, **kwargs)
+    raise ValueError(f"Unknown similarity backend: {backend}")
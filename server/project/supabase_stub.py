@@ -0,0 +1,147 @@
+import copy
+
+
+# In-memory stand-in for the subset of the supabase-py client the server uses
+# (table().select/eq/gt/gte/in_/order/limit/range/insert/update/upsert/execute and rpc().execute),
+# so loaders and endpoints can be exercised locally without a Supabase project.
+#   client = LocalSupabase({"users": [{"id": 1, "embedding": "[0.1, ...]"}]})
+#   client.table("users").select("id, embedding").order("id").limit(2).execute().data
+# Postgres functions called through rpc() are stood in for by Python callables,
+# functions={"name": fn} with fn(client, **params) -> list of rows.
+
+
+class StubResponse:
+    # like supabase-py's APIResponse: attributes only, no dict-style access
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class StubQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.columns = None
+        self.count = None
+        self.head = False
+        self.filters = []
+        self.orders = []
+        self.offset = 0
+        self.max_rows = None
+        self.write = None
+
+    def select(self, columns="*", count=None, head=False):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        self.count = count
+        self.head = head
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self.max_rows = n
+        return self
+
+    def range(self, start, end):
+        self.offset = start
+        self.max_rows = end - start + 1
+        return self
+
+    def insert(self, rows):
+        self.write = ("insert", rows if isinstance(rows, list) else [rows], None)
+        return self
+
+    def upsert(self, rows, on_conflict="id"):
+        self.write = ("upsert", rows if isinstance(rows, list) else [rows], on_conflict)
+        return self
+
+    def update(self, values):
+        self.write = ("update", values, None)
+        return self
+
+    def _matches(self):
+        return [row for row in self.client.tables.setdefault(self.table, [])
+                if all(f(row) for f in self.filters)]
+
+    def execute(self):
+        self.client.calls.append((self.table, "write" if self.write else "select"))
+        if self.write is not None:
+            return self._execute_write()
+
+        rows = self._matches()
+        total = len(rows)
+        for column, desc in reversed(self.orders):
+            rows = sorted(rows, key=lambda row: row.get(column), reverse=desc)
+        rows = rows[self.offset:]
+        if self.max_rows is not None:
+            rows = rows[: self.max_rows]
+        if self.columns is not None:
+            rows = [{c: row.get(c) for c in self.columns} for row in rows]
+        rows = [] if self.head else copy.deepcopy(rows)
+        return StubResponse(rows, count=total if self.count else None)
+
+    def _execute_write(self):
+        kind, payload, key = self.write
+        table = self.client.tables.setdefault(self.table, [])
+        if kind == "update":
+            rows = self._matches()
+            for row in rows:
+                row.update(payload)
+            return StubResponse(copy.deepcopy(rows))
+        written = []
+        by_key = {r.get(key): r for r in table} if kind == "upsert" else {}
+        for row in payload:
+            existing = by_key.get(row.get(key)) if kind == "upsert" else None
+            if existing is None:
+                existing = {}
+                table.append(existing)
+                if kind == "upsert":
+                    by_key[row.get(key)] = existing
+            existing.update(copy.deepcopy(row))
+            written.append(copy.deepcopy(existing))
+        return StubResponse(written)
+
+
+class StubRpc:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params or {}
+
+    def execute(self):
+        self.client.calls.append((self.name, "rpc"))
+        if self.name not in self.client.functions:
+            raise ValueError(f"Unknown function: {self.name}")
+        return StubResponse(copy.deepcopy(self.client.functions[self.name](self.client, **self.params)))
+
+
+class LocalSupabase:
+    def __init__(self, tables=None, functions=None):
+        self.tables = tables if tables is not None else {}
+        self.functions = functions if functions is not None else {}
+        self.calls = []  # (table or function, kind) per round-trip
+
+    def table(self, name):
+        return StubQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return StubRpc(self, name, params)
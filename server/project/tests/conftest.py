@@ -0,0 +1,6 @@
+import os
+import sys
+
+
+# the server modules are imported by name (python app.py / uvicorn app:app from server/project)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,48 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+
+import app as server
+from batching import MicroBatcher
+from supabase_stub import LocalSupabase
+
+
+def fake_classify(texts, batch_size=16):
+    return [{"label": "long" if len(text) > 10 else "short", "score": 1.0} for text in texts]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    supabase = LocalSupabase({"users": [{"id": 1, "text": "a fairly long answer"}, {"id": 2, "text": "short"}]})
+    monkeypatch.setattr(server, "supabase", supabase)
+    monkeypatch.setattr(server, "classify_texts", fake_classify)
+    # what the lifespan sets up, without loading PSYCHBERT
+    server.app.state.executor = ThreadPoolExecutor(max_workers=1)
+    server.app.state.classify_batcher = MicroBatcher(fake_classify, executor=server.app.state.executor)
+    yield TestClient(server.app)
+    server.app.state.executor.shutdown()
+
+
+def test_classify_user_goes_through_the_batcher(client):
+    response = client.post("/classifyUser", params={"user_id": 1})
+    assert response.status_code == 200
+    assert response.json() == {"label": "long", "score": 1.0}
+
+
+def test_classify_user_unknown_user(client):
+    response = client.post("/classifyUser", params={"user_id": 99})
+    assert response.status_code == 404
+
+
+def test_classify_users(client):
+    response = client.post("/classifyUsers", json={"user_ids": [2, 1, 99]})
+    assert response.status_code == 200
+    assert response.json() == {
+        "results": [{"user_id": 2, "label": "short", "score": 1.0}, {"user_id": 1, "label": "long", "score": 1.0}],
+        "missing": [99],
+    }
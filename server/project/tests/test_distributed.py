@@ -0,0 +1,52 @@
+import os
+import socket
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+
+from test_train import make_data, make_model, requires_sampler
+from train import TrainingController, setup_distributed, train_gnn_minibatch
+
+
+class RecordingController(TrainingController):
+    # notes whether this rank's checkpoint exists before finish() cleans it up
+    def finish(self):
+        self.wrote_checkpoint = os.path.exists(self.checkpoint_path)
+        return super().finish()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_rank(rank, world_size, port, directory):
+    os.environ.update({"RANK": str(rank), "WORLD_SIZE": str(world_size),
+                       "MASTER_ADDR": "127.0.0.1", "MASTER_PORT": str(port)})
+    rank, world_size, _ = setup_distributed("gloo")
+    try:
+        model = DistributedDataParallel(make_model())
+        optimizer = torch.optim.Adam(model.parameters(), lr=0.01)
+        # a checkpoint path per rank, so a write by a non-writer rank would show up
+        controller = RecordingController(model, optimizer, checkpoint_path=os.path.join(directory, f"checkpoint{rank}.pt"),
+                                         checkpoint_every=1, writer=rank == 0)
+        trained = train_gnn_minibatch(model, make_data(), optimizer, epochs=3, batch_size=8, fanout=4,
+                                      rank=rank, world_size=world_size, controller=controller)
+        torch.save({"state": trained.module.state_dict(), "wrote_checkpoint": controller.wrote_checkpoint},
+                   os.path.join(directory, f"rank{rank}.pt"))
+    finally:
+        dist.destroy_process_group()
+
+
+@requires_sampler
+def test_gloo_ranks_train_the_same_model(tmp_path):
+    mp.spawn(run_rank, args=(2, free_port(), str(tmp_path)), nprocs=2, join=True)
+    results = [torch.load(tmp_path / f"rank{rank}.pt") for rank in range(2)]
+    for key, value in results[0]["state"].items():
+        torch.testing.assert_close(results[1]["state"][key], value, rtol=0, atol=0)
+    assert results[0]["wrote_checkpoint"]
+    assert not results[1]["wrote_checkpoint"]
+    assert not list(tmp_path.glob("checkpoint*.pt"))
@@ -0,0 +1,114 @@
+import base64
+import threading
+
+import numpy as np
+
+from embedding_store import EmbeddingCache, format_vectors, load_embeddings
+from supabase_stub import LocalSupabase
+
+DIM = 4
+
+
+def make_rows(ids, rng, updated_at="2026-01-01T00:00:00"):
+    vectors = rng.normal(size=(len(ids), DIM)).astype(np.float32)
+    return [{"id": u, "embedding": v, "updated_at": updated_at}
+            for u, v in zip(ids, format_vectors(vectors))]
+
+
+def as_dict(embeddings, user_ids):
+    return {u: np.asarray(row) for u, row in zip(user_ids, embeddings)}
+
+
+def assert_same(actual, expected):
+    assert list(actual[1]) == list(expected[1])
+    np.testing.assert_array_equal(np.asarray(actual[0]), np.asarray(expected[0]))
+
+
+def test_load_embeddings_pages_through_the_table():
+    rng = np.random.default_rng(0)
+    rows = make_rows(range(1, 11), rng)
+    rows[4]["embedding"] = None  # users without an embedding yet are skipped
+    client = LocalSupabase({"users": rows})
+
+    embeddings, user_ids = load_embeddings(client, dim=DIM, page_size=3)
+
+    expected = [row for row in rows if row["embedding"] is not None]
+    assert embeddings.dtype == np.float32
+    assert user_ids == [row["id"] for row in expected]
+    for row, vector in zip(expected, embeddings):
+        np.testing.assert_allclose(vector, np.array(row["embedding"][1:-1].split(","), dtype=np.float32))
+
+
+def test_load_embeddings_base64():
+    vectors = np.random.default_rng(1).normal(size=(5, DIM)).astype("<f4")
+    client = LocalSupabase({"users": [{"id": i, "embedding": base64.b64encode(v.tobytes()).decode()}
+                                      for i, v in enumerate(vectors)]})
+    embeddings, user_ids = load_embeddings(client, dim=DIM, page_size=2, wire_format="base64")
+    assert user_ids == list(range(5))
+    np.testing.assert_array_equal(embeddings, vectors)
+
+
+def test_refresh_applies_changed_new_and_pruned_rows(tmp_path):
+    rng = np.random.default_rng(2)
+    client = LocalSupabase({"users": make_rows(range(1, 21), rng)})
+    cache = EmbeddingCache(str(tmp_path), dim=DIM, page_size=5)
+
+    first = cache.refresh(client)
+    assert_same(first, load_embeddings(client, dim=DIM))
+    before = np.array(first[0])
+
+    users = client.tables["users"]
+    changed = make_rows([3, 11], rng, updated_at="2026-02-01T00:00:00")
+    for row in users:
+        for update in changed:
+            if row["id"] == update["id"]:
+                row.update(update)
+    users.extend(make_rows([21, 22], rng, updated_at="2026-02-01T00:00:00"))
+    client.tables["users"] = [row for row in users if row["id"] != 7]
+
+    client.calls.clear()
+    refreshed = cache.refresh(client)
+    calls = list(client.calls)
+    expected = load_embeddings(client, dim=DIM)
+    assert as_dict(*refreshed).keys() == as_dict(*expected).keys()
+    for u, row in as_dict(*expected).items():
+        np.testing.assert_array_equal(as_dict(*refreshed)[u], row)
+    assert 7 not in refreshed[1]
+    # the four updated rows fit one page, plus the id-only prune scan
+    assert calls == [("users", "select")] * 2
+    assert cache.load()[2] == "2026-02-01T00:00:00"
+    # an array handed out earlier is never patched in place
+    np.testing.assert_array_equal(np.asarray(first[0]), before)
+
+    client.calls.clear()
+    again = cache.refresh(client, prune=False)
+    assert_same(again, refreshed)
+    assert client.calls == [("users", "select")]
+
+
+def test_concurrent_refreshes_agree(tmp_path):
+    rng = np.random.default_rng(3)
+    client = LocalSupabase({"users": make_rows(range(1, 201), rng)})
+    cache = EmbeddingCache(str(tmp_path), dim=DIM, page_size=16)
+    cache.refresh(client)
+    client.tables["users"].extend(make_rows(range(201, 241), rng, updated_at="2026-02-01T00:00:00"))
+
+    results, errors = [], []
+
+    def refresh():
+        try:
+            results.append(cache.refresh(client))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=refresh) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    expected = load_embeddings(client, dim=DIM)
+    for result in results:
+        assert_same(result, expected)
+    assert not list(tmp_path.glob("*.tmp"))
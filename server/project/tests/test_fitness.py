@@ -0,0 +1,59 @@
+import random
+
+import numpy as np
+import pytest
+
+from models import GeneticAlgorithm
+
+
+# evaluate_individual sums float32 similarity blocks, the batched and delta paths accumulate the same
+# values in float64, so scores agree to float32 rounding rather than bit for bit
+TOLERANCE = 1e-6
+
+
+def make_ga(n_users=40, dim=16, similarity="dense", seed=0):
+    embeddings = np.random.default_rng(seed).normal(size=(n_users, dim)).astype(np.float32)
+    return GeneticAlgorithm(n_users, embeddings, embedding_size=dim, similarity=similarity)
+
+
+@pytest.mark.parametrize("similarity", ["dense", "embedding"])
+def test_evaluate_population_matches_evaluate_individual(similarity):
+    ga = make_ga(similarity=similarity)
+    random.seed(1)
+    population = ga.toolbox.population(n=20)
+    expected = [ga.evaluate_individual(ind)[0] for ind in population]
+    scores = [fit[0] for fit in ga.evaluate_population(population)]
+    assert scores == pytest.approx(expected, rel=0, abs=TOLERANCE)
+
+
+def test_delta_evaluation_matches_evaluate_individual():
+    ga = make_ga()
+    random.seed(2)
+    population = ga.toolbox.population(n=10)
+    ga.evaluate_population(population)
+    scores = []
+    for ind in population:
+        # a mutated clone keeps the group cache of its parent and is rescored by delta
+        ind[0] = (ind[0] + 1) % ga.NUM_GROUPS
+        ind[5] = ind[7]
+        fit = ga._evaluate_delta(ind)
+        assert fit is not None
+        scores.append(fit[0])
+    expected = [ga.evaluate_individual(ind)[0] for ind in population]
+    assert scores == pytest.approx(expected, rel=0, abs=TOLERANCE)
+
+
+def test_batched_and_per_individual_runs_agree():
+    ga = make_ga()
+    best_batched, log_batched = ga.run_genetic_algorithm(pop_size=20, n_gen=5, batched=True, seed=3, verbose=False)
+    best_plain, log_plain = ga.run_genetic_algorithm(pop_size=20, n_gen=5, batched=False, seed=3, verbose=False)
+    assert list(best_batched) == list(best_plain)
+    assert log_batched.select("max") == pytest.approx(log_plain.select("max"), rel=0, abs=TOLERANCE)
+
+
+def test_serial_and_parallel_runs_agree():
+    ga = make_ga()
+    best_serial, log_serial = ga.run_genetic_algorithm(pop_size=20, n_gen=5, seed=4, verbose=False)
+    best_parallel, log_parallel = ga.run_genetic_algorithm(pop_size=20, n_gen=5, n_workers=2, seed=4, verbose=False)
+    assert list(best_serial) == list(best_parallel)
+    assert log_serial.select("max") == pytest.approx(log_parallel.select("max"), rel=0, abs=TOLERANCE)
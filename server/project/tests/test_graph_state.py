@@ -0,0 +1,47 @@
+import numpy as np
+import torch
+
+from graph_state import GraphState
+from models import customGNN
+
+
+def make_model(dim=8):
+    torch.manual_seed(0)
+    return customGNN(input_size=dim, hidden_size=dim, output_size=dim).eval()
+
+
+def test_incremental_sync_matches_full_sync():
+    rng = np.random.default_rng(0)
+    # well separated clusters keep the 4-hop receptive field of a change inside its cluster
+    centers = rng.normal(size=(50, 8)) * 10
+    embeddings = (np.repeat(centers, 30, axis=0) + rng.normal(size=(1500, 8))).astype(np.float32)
+    user_ids = list(range(1500))
+    model = make_model()
+
+    state = GraphState(k=5)
+    state.sync(embeddings, user_ids, model)
+
+    # a few users changed their answers and two joined
+    updated = embeddings.copy()
+    updated[[3, 700, 1200]] += rng.normal(size=(3, 8)).astype(np.float32)
+    updated = np.concatenate([updated, (centers[[10, 20]] + rng.normal(size=(2, 8))).astype(np.float32)])
+    updated_ids = user_ids + [1500, 1501]
+
+    refined, version = state.sync(updated, updated_ids, model)
+    assert state.last_update["mode"] == "incremental"
+    assert state.last_update["subgraph"] < len(updated_ids)
+    assert version == 2
+
+    expected, _ = GraphState(k=5).sync(updated, updated_ids, model)
+    torch.testing.assert_close(refined, expected, rtol=0, atol=1e-5)
+
+
+def test_unchanged_sync_keeps_version():
+    embeddings = np.random.default_rng(1).normal(size=(100, 8)).astype(np.float32)
+    model = make_model()
+    state = GraphState(k=5)
+    first, version = state.sync(embeddings, list(range(100)), model)
+    again, same_version = state.sync(embeddings, list(range(100)), model)
+    assert state.last_update["mode"] == "unchanged"
+    assert same_version == version
+    torch.testing.assert_close(again, first, rtol=0, atol=0)
@@ -0,0 +1,28 @@
+import pytest
+import torch
+
+from inference import BACKENDS, drift, optimize_model, warmup_data
+from models import customGNN
+
+
+def make_model(dim=8):
+    torch.manual_seed(0)
+    return customGNN(input_size=dim, hidden_size=dim, output_size=dim).eval()
+
+
+def test_unknown_backend_is_rejected():
+    assert "script" not in BACKENDS
+    with pytest.raises(ValueError):
+        optimize_model(make_model(), backend="script")
+
+
+@pytest.mark.parametrize("precision", ["fp32", "int8", "bf16"])
+def test_optimized_model_stays_close_to_eager(precision):
+    model = make_model()
+    optimized, errors = optimize_model(model, precision=precision)
+    assert errors == []
+    assert optimized.precision == precision
+    report = drift(model, optimized, warmup_data(num_nodes=64, input_size=8, k=4), repeats=1)
+    assert report["min_cosine"] > 0.95
+    if precision == "fp32":
+        assert report["max_abs"] < 1e-5
@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+# app.py creates its Supabase client at import time, the tests swap it for LocalSupabase
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+
+import app as server
+from embedding_store import parse_vectors, update_user_embeddings_stub
+from jobs import JobManager
+from supabase_stub import LocalSupabase
+
+DIM = 4
+
+
+def fake_encode(texts):
+    # deterministic stand-in for the sentence encoder: text length and line count
+    return np.array([[len(t), t.count("\n") + 1, 0, 1] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    supabase = LocalSupabase(
+        {"users": [{"id": u, "text": f"old text {u}", "embedding": None, "updated_at": None} for u in (1, 2, 3)]},
+        functions={"update_user_embeddings": update_user_embeddings_stub()},
+    )
+    monkeypatch.setattr(server, "supabase", supabase)
+    monkeypatch.setattr(server, "encode_sentences", fake_encode)
+    # no lifespan here (it loads models), only the ingest admission control it would set up
+    server.app.state.ingest_jobs = JobManager(max_running=1, max_queued=4)
+    yield TestClient(server.app), supabase
+    server.app.state.ingest_jobs.shutdown()
+
+
+def test_ingest_answers_updates_existing_users(client):
+    http, supabase = client
+    response = http.post("/ingestAnswers", json={"users": [
+        {"user_id": 1, "texts": ["I like hiking", "Mornings"]},
+        {"user_id": 2, "texts": ["Quiet evenings"]},
+        {"user_id": 2, "texts": ["and books"]},
+        {"user_id": 3, "texts": ["  ", ""]},
+        {"user_id": 99, "texts": ["nobody"]},
+    ], "chunk_size": 2})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "done"
+    assert body["result"] == {"users": 2, "skipped": [3], "missing": [99], "updates": 2}
+
+    rows = {row["id"]: row for row in supabase.tables["users"]}
+    np.testing.assert_array_equal(parse_vectors([rows[1]["embedding"]], DIM)[0],
+                                  fake_encode(["I like hiking\nMornings"])[0])
+    np.testing.assert_array_equal(parse_vectors([rows[2]["embedding"]], DIM)[0],
+                                  fake_encode(["Quiet evenings\nand books"])[0])
+    assert rows[1]["updated_at"] is not None and rows[2]["updated_at"] is not None
+    assert rows[3]["embedding"] is None and rows[3]["updated_at"] is None
+    # answers only feed the embedding, users.text stays as it was
+    assert [rows[u]["text"] for u in (1, 2, 3)] == ["old text 1", "old text 2", "old text 3"]
+    assert len(supabase.tables["users"]) == 3
+
+
+def test_ingest_answers_without_texts_skips_the_database(client):
+    http, supabase = client
+    response = http.post("/ingestAnswers", json={"users": [{"user_id": 1, "texts": []}]})
+    assert response.status_code == 200
+    assert response.json()["result"] == {"users": 0, "skipped": [1], "missing": [], "updates": 0}
+    assert supabase.calls == []
@@ -0,0 +1,50 @@
+import numpy as np
+import torch
+from torch_geometric.data import Data
+
+from embedding_store import format_vectors, load_embeddings
+from graph_state import GraphState
+from knn_provider import LocalKNN, PgvectorKNN, match_user_neighbors_stub, neighborhood_graph
+from models import customGNN
+from supabase_stub import LocalSupabase
+
+DIM = 8
+
+
+def make_client(seed=0):
+    rng = np.random.default_rng(seed)
+    # separated clusters, so the 4-hop receptive field of a few users is a real subgraph
+    centers = rng.normal(size=(20, DIM)) * 10
+    vectors = (np.repeat(centers, 30, axis=0) + rng.normal(size=(600, DIM))).astype(np.float32)
+    rows = [{"id": u, "embedding": v} for u, v in zip(range(1, 601), format_vectors(vectors))]
+    return LocalSupabase({"users": rows}, functions={"match_user_neighbors": match_user_neighbors_stub(dim=DIM)})
+
+
+def test_pgvector_neighbors_match_local_knn():
+    client = make_client()
+    remote = PgvectorKNN(client, dim=DIM, batch_size=7)
+    local = LocalKNN.from_client(client, dim=DIM)
+    ids = [1, 50, 333, 600]
+    assert remote.neighbors(ids, 5) == local.neighbors(ids, 5)
+    incoming = [{u: sorted(v) for u, v in knn.neighbors(ids, 5, incoming=True).items()} for knn in (remote, local)]
+    assert incoming[0] == incoming[1]
+    np.testing.assert_array_equal(remote.features(ids), local.features(ids))
+
+
+def test_neighborhood_graph_gives_the_full_graph_output():
+    client = make_client()
+    torch.manual_seed(0)
+    model = customGNN(input_size=DIM, hidden_size=DIM, output_size=DIM).eval()
+    provider = PgvectorKNN(client, dim=DIM)
+    user_ids = [5, 260, 599]
+
+    nodes, edge_index = neighborhood_graph(provider, user_ids, k=5, num_layers=4)
+    assert nodes[:len(user_ids)] == user_ids
+    assert len(nodes) < 600
+    with torch.no_grad():
+        subset = model(Data(x=torch.from_numpy(provider.features(nodes)), edge_index=edge_index))[:len(user_ids)]
+
+    embeddings, all_ids = load_embeddings(client, dim=DIM)
+    full, _ = GraphState(k=5).sync(embeddings, all_ids, model)
+    expected = full[[all_ids.index(u) for u in user_ids]]
+    torch.testing.assert_close(subset, expected, rtol=0, atol=1e-5)
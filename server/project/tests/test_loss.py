@@ -0,0 +1,41 @@
+import pytest
+import torch
+
+from train import contrastive_loss_chunked, contrastive_loss_vectorized
+
+
+def make_inputs(n=200, dim=16, k=5, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    embeddings = torch.randn(n, dim, generator=generator, dtype=torch.float64, requires_grad=True)
+    src = torch.arange(n).repeat_interleave(k)
+    dst = torch.randint(0, n, (n * k,), generator=generator)
+    return embeddings, torch.stack([src, dst])
+
+
+@pytest.mark.parametrize("block_size", [1, 64, 1024])
+def test_chunked_loss_matches_dense_loss(block_size):
+    embeddings, edge_index = make_inputs()
+    dense = contrastive_loss_vectorized(embeddings, edge_index)
+    (dense_grad,) = torch.autograd.grad(dense, embeddings)
+    chunked = contrastive_loss_chunked(embeddings, edge_index, block_size=block_size)
+    (chunked_grad,) = torch.autograd.grad(chunked, embeddings)
+    torch.testing.assert_close(chunked, dense)
+    torch.testing.assert_close(chunked_grad, dense_grad)
+
+
+def test_chunked_loss_of_seed_rows_matches_dense_loss():
+    embeddings, edge_index = make_inputs()
+    # only the first 50 rows have positives, so the dense loss is theirs alone
+    seeds = edge_index[:, edge_index[0] < 50]
+    dense = contrastive_loss_vectorized(embeddings, seeds)
+    chunked = contrastive_loss_chunked(embeddings, edge_index, block_size=16, rows=50)
+    torch.testing.assert_close(chunked, dense)
+
+
+def test_chunked_loss_without_positives_still_backpropagates():
+    embeddings, edge_index = make_inputs()
+    # none of the first 10 rows is the source of an edge, like a batch of seeds without in-edges
+    loss = contrastive_loss_chunked(embeddings, edge_index[:, edge_index[0] >= 10], rows=10)
+    loss.backward()
+    assert loss.item() == 0
+    assert torch.count_nonzero(embeddings.grad) == 0
@@ -0,0 +1,14 @@
+import os
+
+from embedding_store import UPDATE_USER_EMBEDDINGS_SQL
+from knn_provider import MATCH_USER_NEIGHBORS_SQL
+
+MIGRATION = os.path.join(os.path.dirname(__file__), "..", "..", "..", "migrations", "setup_embedding_functions.sql")
+
+
+def test_migration_creates_the_functions_the_server_calls():
+    with open(MIGRATION) as f:
+        migration = f.read()
+    for sql in (UPDATE_USER_EMBEDDINGS_SQL, MATCH_USER_NEIGHBORS_SQL):
+        assert sql.strip() in migration
+    assert "ADD COLUMN IF NOT EXISTS updated_at" in migration
@@ -0,0 +1,88 @@
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+
+import app as server
+from model_registry import ModelRegistry
+
+
+class Served:
+    def __init__(self, version):
+        self.version = version
+        self.metadata = {"version": version}
+        self.inference_report = {}
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = ModelRegistry(str(tmp_path))
+    registry.register({}, {}, promote=True)
+    registry.register({}, {}, promote=True)
+    loads = []
+
+    def load_served_model(version=None):
+        version = version or registry.latest()
+        loads.append(version)
+        return Served(version)
+
+    monkeypatch.setattr(server, "load_served_model", load_served_model)
+    monkeypatch.setattr(server, "run_blocking", lambda fn, *args: asyncio.sleep(0, fn(*args)))
+    server.app.state.registry = registry
+    server.app.state.served = Served("v0002")
+    server.app.state.pinned_version = None
+    return registry, loads
+
+
+async def poll_once(seconds=0.05):
+    poller = asyncio.create_task(server.poll_registry(0.01))
+    await asyncio.sleep(seconds)
+    poller.cancel()
+
+
+def test_reload_without_promote_pins_the_version(registry):
+    registry, loads = registry
+
+    async def run():
+        server.app.state.model_lock = asyncio.Lock()
+        response = await server.reload_models("v0001")
+        assert response["pinned"]
+        await poll_once()
+
+    asyncio.run(run())
+    assert server.app.state.served.version == "v0001"
+    assert loads == ["v0001"]
+    assert registry.latest() == "v0002"
+
+
+def test_reload_latest_unpins(registry):
+    registry, loads = registry
+
+    async def run():
+        server.app.state.model_lock = asyncio.Lock()
+        await server.reload_models("v0001")
+        response = await server.reload_models()
+        assert not response["pinned"]
+        registry.register({}, {}, promote=True)
+        await poll_once()
+
+    asyncio.run(run())
+    assert server.app.state.pinned_version is None
+    assert server.app.state.served.version == "v0003"
+
+
+def test_reload_with_promote_does_not_pin(registry):
+    registry, loads = registry
+
+    async def run():
+        server.app.state.model_lock = asyncio.Lock()
+        response = await server.reload_models("v0001", promote=True)
+        assert not response["pinned"]
+        await poll_once()
+
+    asyncio.run(run())
+    assert registry.latest() == "v0001"
+    assert server.app.state.served.version == "v0001"
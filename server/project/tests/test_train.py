@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import torch
+import torch_geometric.typing
+from torch_geometric.data import Data
+
+from knn_graph import build_edge_index
+from models import customGNN
+from train import TrainingController, train_gnn_minibatch
+
+# NeighborLoader samples with pyg-lib or torch-sparse, neither ships with torch_geometric itself
+requires_sampler = pytest.mark.skipif(
+    not (torch_geometric.typing.WITH_PYG_LIB or torch_geometric.typing.WITH_TORCH_SPARSE),
+    reason="NeighborLoader needs pyg-lib or torch-sparse",
+)
+
+
+def make_data(n=48, dim=8, k=4, seed=0):
+    embeddings = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return Data(x=torch.from_numpy(embeddings), edge_index=build_edge_index(embeddings, k=k))
+
+
+def make_model(dim=8):
+    torch.manual_seed(0)
+    return customGNN(input_size=dim, hidden_size=dim, output_size=dim)
+
+
+@requires_sampler
+def test_minibatch_training_improves_the_loss():
+    data = make_data()
+    model = make_model()
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.01)
+    controller = TrainingController(model, optimizer)
+    train_gnn_minibatch(model, data, optimizer, epochs=5, batch_size=16, fanout=4, controller=controller)
+    assert np.isfinite(controller.best_loss)
+    assert controller.best_epoch is not None
+
+
+@requires_sampler
+def test_minibatch_training_survives_batches_without_positives():
+    # no edges at all: no seed has a sampled in-neighbour, so every batch has an empty positive set
+    data = make_data()
+    data.edge_index = torch.empty((2, 0), dtype=torch.long)
+    model = make_model()
+    before = [p.detach().clone() for p in model.parameters()]
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    train_gnn_minibatch(model, data, optimizer, epochs=2, batch_size=16, fanout=4,
+                        controller=TrainingController(model, optimizer))
+    for old, new in zip(before, model.parameters()):
+        torch.testing.assert_close(new, old)
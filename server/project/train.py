@@ -1,28 +1,44 @@
-from datasets import load_dataset
-from sentence_transformers import SentenceTransformer
-import pandas as pd
 from models import customGNN
 import numpy as np
 import torch
 import torch.optim as optim
 import torch.nn.functional as F
-from sklearn.neighbors import NearestNeighbors
+import torch.utils.checkpoint
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from knn_graph import build_edge_index
+from embed_corpus import build_embeddings, load_embeddings
+from model_registry import ModelRegistry
 from torch_geometric.data import Data
+from torch_geometric.loader import NeighborLoader
 import random
 import logging
+import argparse
+import resource
+import time
+import sys
+import os
 
-# logging setup write to console and file
 logger = logging.getLogger("train_logger")
-logger.setLevel(logging.INFO)
-c_handler = logging.StreamHandler()
-f_handler = logging.FileHandler("train.log")
-c_handler.setLevel(logging.INFO)
-f_handler.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-c_handler.setFormatter(formatter)
-f_handler.setFormatter(formatter)
-logger.addHandler(c_handler)
-logger.addHandler(f_handler)
+
+# logging setup write to console and file, done by main() so importing the training functions
+# (tests, benchmarks) neither creates train.log nor reseeds the caller's RNGs
+def setup_logging(rank=0, path="train.log"):
+    if logger.handlers:
+        return
+    logger.setLevel(logging.INFO)
+    c_handler = logging.StreamHandler()
+    f_handler = logging.FileHandler(path)
+    c_handler.setLevel(logging.INFO)
+    f_handler.setLevel(logging.INFO)
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    c_handler.setFormatter(formatter)
+    f_handler.setFormatter(formatter)
+    logger.addHandler(c_handler)
+    logger.addHandler(f_handler)
+    # under torchrun only rank 0 writes progress to the console and train.log
+    if rank != 0:
+        logger.setLevel(logging.WARNING)
 
 # random seeds for reproducibility
 def set_seeds(seed=42):
@@ -33,80 +49,17 @@ def set_seeds(seed=42):
         torch.cuda.manual_seed_all(seed)
     logger.info(f"Random seeds set to {seed}")
 
-set_seeds(42)
-
-"""
-
-using huggingface dataset to load data
-generating user_id,embedding for each user
-saving embeddings to user_embeddings.csv
-
-this function is to initially train the model
-
-later on user data will be used to train the model
-
-
-"""
-def generate_and_save_embeddings():
-    logger.info("Loading dataset 'jingjietan/essays-big5'...")
-    ds = load_dataset("jingjietan/essays-big5")
-    all_data = (
-        [
-            {"user_id": f"train_{idx + 1}", "text": row["text"]}
-            for idx, row in enumerate(ds["train"])
-        ]
-        + [
-            {"user_id": f"val_{idx + 1}", "text": row["text"]}
-            for idx, row in enumerate(ds["validation"])
-        ]
-        + [
-            {"user_id": f"test_{idx + 1}", "text": row["text"]}
-            for idx, row in enumerate(ds["test"])
-        ]
-    )
-
-    logger.info("Generating embeddings with SentenceTransformer (all-mpnet-base-v2)...")
-    model = SentenceTransformer('all-mpnet-base-v2')
-    texts = [item["text"] for item in all_data]
-    embeddings = model.encode(texts, show_progress_bar=True)
-
-    for i, item in enumerate(all_data):
-        item["embedding"] = embeddings[i].tolist()
-
-    pd.DataFrame(all_data).to_csv("user_embeddings.csv", index=False)
-    logger.info("Embeddings saved to user_embeddings.csv.")
-
-
-generate_and_save_embeddings()
-
-#util function to load embeddings from csv
-def load_embeddings_from_csv(csv_path="user_embeddings.csv"):
-    logger.info("Loading embeddings from CSV...")
-    df = pd.read_csv(csv_path)
-    df["embedding"] = df["embedding"].apply(lambda x: np.fromstring(x.strip("[]"), sep=", "))
-    embeddings = np.stack(df["embedding"].values)  # Shape: (num_users, 768)
-    user_ids = df["user_id"].values.tolist()
-    logger.info(f"Loaded embeddings for {len(user_ids)} users.")
-    return embeddings, user_ids
-
-
-#knn for each user represented as an edge list
-def build_knn_graph(embeddings: np.ndarray, k=10):
+#knn for each user represented as an edge_index tensor, index is "exact", "rp" or "hnsw" (see knn_graph.py)
+def build_knn_graph(embeddings: np.ndarray, k=10, index="exact"):
     logger.info("Building KNN graph...")
-    nbrs = NearestNeighbors(n_neighbors=k+1, metric="cosine").fit(embeddings)
-    _, indices = nbrs.kneighbors(embeddings)
-    edge_list = []
-    for i, neighbors in enumerate(indices):
-        for neighbor in neighbors[1:]:  # skip self 
-            edge_list.append((i, neighbor))
+    edge_index = build_edge_index(embeddings, k=k, index=index)
     logger.info("KNN graph built.")
-    return edge_list
+    return edge_index
 
 
 #pytorch geometric data object
-def create_data_object(embeddings: np.ndarray, edge_list: list):
+def create_data_object(embeddings: np.ndarray, edge_index: torch.Tensor):
     logger.info("Creating PyTorch Geometric Data object...")
-    edge_index = torch.tensor(edge_list, dtype=torch.long).t().contiguous()
     x = torch.tensor(embeddings, dtype=torch.float)
     data = Data(x=x, edge_index=edge_index)
     logger.info("Data object created.")
@@ -155,52 +108,324 @@ def contrastive_loss_vectorized(embeddings, edge_index, tau=0.5):
     return loss
 
 
+def _positive_pairs(edge_index, N):
+    # unique (src, dst) edges without self loops, the pairs pos_mask marks
+    src, dst = edge_index
+    keep = src != dst
+    key = torch.unique(src[keep] * N + dst[keep])
+    return key // N, key % N
+
+
+def _block_denominator(norm_embeddings, start, stop, tau):
+    # log sum_{j != i} exp(sim_ij / tau) for rows start:stop, only a [B, N] block is live
+    block = torch.mm(norm_embeddings[start:stop], norm_embeddings.t()) / tau
+    rows = torch.arange(stop - start, device=block.device)
+    diag = torch.zeros_like(block, dtype=torch.bool)
+    diag[rows, rows + start] = True
+    return torch.logsumexp(block.masked_fill(diag, float("-inf")), dim=1)
+
+
+def _block_sampled_denominator(norm_embeddings, negatives, start, stop, tau):
+    # log sum_m exp(sim_i,neg_im / tau) for rows start:stop, [B]
+    block = torch.einsum("bd,bmd->bm", norm_embeddings[start:stop], norm_embeddings[negatives[start:stop]]) / tau
+    return torch.logsumexp(block, dim=1)
+
+
+def contrastive_loss_chunked(embeddings, edge_index, tau=0.5, block_size=1024, negatives=None, checkpoint=True,
+                             rows=None):
+    """
+    Same loss as contrastive_loss_vectorized without any N x N tensor.
+    The denominator is a row-wise log-sum-exp computed block_size rows at a time (each block
+    is recomputed in backward when checkpoint=True, so only [N] values are kept), positives
+    are gathered straight from edge_index.
+    negatives=m replaces the full denominator with m uniformly sampled non-self nodes per row,
+    scaled up to the N - 1 - deg non-positive nodes, so an epoch costs O(N*k + N*m).
+    rows=R only computes the loss of the first R nodes (against all N), e.g. the seed nodes of
+    a sampled subgraph; edges from other nodes are ignored.
+    """
+    norm_embeddings = F.normalize(embeddings, p=2, dim=1)
+    N = embeddings.size(0)
+    R = N if rows is None else min(rows, N)
+    device = embeddings.device
+
+    src, dst = _positive_pairs(edge_index, N)
+    if R < N:
+        src, dst = src[src < R], dst[src < R]
+    pos_exp = torch.exp((norm_embeddings[src] * norm_embeddings[dst]).sum(dim=1) / tau)
+    pos_sum = torch.zeros(R, device=device, dtype=pos_exp.dtype).index_add(0, src, pos_exp)
+    degree = torch.bincount(src, minlength=R)
+    valid = degree > 0
+    if valid.sum() == 0:
+        # still attached to the graph, so backward() works (and DDP ranks stay in step) on a
+        # batch whose seeds have no positives
+        return embeddings.sum() * 0
+
+    if negatives:
+        # draw from the N - 1 other nodes by shifting indices at or above the row's own index
+        sampled = torch.randint(0, max(N - 1, 1), (R, negatives), device=device)
+        sampled = sampled + (sampled >= torch.arange(R, device=device)[:, None]).long()
+        block_fn = lambda start, stop: _block_sampled_denominator(norm_embeddings, sampled, start, stop, tau)
+    else:
+        block_fn = lambda start, stop: _block_denominator(norm_embeddings, start, stop, tau)
+
+    log_denom = []
+    for start in range(0, R, block_size):
+        stop = min(start + block_size, R)
+        if checkpoint and torch.is_grad_enabled():
+            log_denom.append(torch.utils.checkpoint.checkpoint(block_fn, start, stop, use_reentrant=False))
+        else:
+            log_denom.append(block_fn(start, stop))
+    log_denom = torch.cat(log_denom)
+
+    if negatives:
+        scale = (N - 1 - degree).clamp_min(0).to(log_denom.dtype) / negatives
+        denom = pos_sum + scale * torch.exp(log_denom)
+    else:
+        denom = torch.exp(log_denom)
+
+    loss = -torch.log((pos_sum / (denom + 1e-9)) + 1e-9)
+    return loss[valid].mean()
+
+
+class TrainingController:
+    """
+    Decides when training stops and keeps the best weights.
+    step(epoch, loss) feeds the epoch loss to a ReduceLROnPlateau scheduler, copies the weights
+    into a preallocated best-state buffer when the loss improves by more than min_delta, and
+    returns True once `patience` epochs in a row did not improve. With a checkpoint_path the
+    model, optimizer, scheduler and best state are saved every checkpoint_every epochs (by the
+    writer only) and resume() continues a killed run from the last checkpoint.
+    """
+    def __init__(self, model, optimizer, patience=20, min_delta=1e-4, lr_factor=0.5, lr_patience=5,
+                 min_lr=1e-5, checkpoint_path=None, checkpoint_every=10, writer=True):
+        self.model = model
+        self.optimizer = optimizer
+        self.scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode="min", factor=lr_factor,
+                                                              patience=lr_patience, min_lr=min_lr)
+        self.patience = patience
+        self.min_delta = min_delta
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.writer = writer
+        self.best_state = {key: torch.empty_like(value) for key, value in model.state_dict().items()}
+        self.best_loss = float('inf')
+        self.best_epoch = None
+        self.bad_epochs = 0
+
+    def resume(self):
+        # epoch to start from, 0 when there is no checkpoint
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        checkpoint = torch.load(self.checkpoint_path, map_location=next(self.model.parameters()).device)
+        self.model.load_state_dict(checkpoint["model"])
+        self.optimizer.load_state_dict(checkpoint["optimizer"])
+        self.scheduler.load_state_dict(checkpoint["scheduler"])
+        for key, value in checkpoint["best_state"].items():
+            self.best_state[key].copy_(value)
+        self.best_loss, self.best_epoch, self.bad_epochs = checkpoint["best_loss"], checkpoint["best_epoch"], checkpoint["bad_epochs"]
+        logger.info(f"Resumed from {self.checkpoint_path} at epoch {checkpoint['epoch'] + 1}")
+        return checkpoint["epoch"] + 1
+
+    def step(self, epoch, loss):
+        if loss < self.best_loss - self.min_delta:
+            self.best_loss, self.best_epoch, self.bad_epochs = loss, epoch, 0
+            with torch.no_grad():
+                for key, value in self.model.state_dict().items():
+                    self.best_state[key].copy_(value)
+        else:
+            self.bad_epochs += 1
+        self.scheduler.step(loss)
+        if self.checkpoint_path and self.writer and (epoch + 1) % self.checkpoint_every == 0:
+            save_checkpoint({"epoch": epoch, "model": self.model.state_dict(), "optimizer": self.optimizer.state_dict(),
+                             "scheduler": self.scheduler.state_dict(), "best_state": self.best_state,
+                             "best_loss": self.best_loss, "best_epoch": self.best_epoch,
+                             "bad_epochs": self.bad_epochs}, self.checkpoint_path)
+        if self.bad_epochs >= self.patience:
+            logger.info(f"Early stopping at epoch {epoch + 1}, no improvement for {self.patience} epochs.")
+            return True
+        return False
+
+    def finish(self):
+        # loads the best weights, a finished run no longer needs its resume checkpoint
+        logger.info(f"Best training loss: {self.best_loss:.4f} (epoch {(self.best_epoch or 0) + 1})")
+        if self.best_epoch is not None:
+            self.model.load_state_dict(self.best_state)
+        if self.checkpoint_path and self.writer and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        return self.model
+
+    def lr(self):
+        return self.optimizer.param_groups[0]["lr"]
+
+
 #gnn training loop with constrastive loss function and gradient clipping 
-def train_gnn(model, data, optimizer, epochs=200, tau=0.5, clip_value=1.0):
+#the loss is computed block_size rows at a time, negatives=m switches it to m sampled negatives per node
+#controller (a TrainingController by default) handles early stopping, LR decay and checkpoints
+def train_gnn(model, data, optimizer, epochs=200, tau=0.5, clip_value=1.0, block_size=1024, negatives=None,
+              controller=None):
     logger.info("Starting GNN training...")
-    best_loss = float('inf')
-    best_state = None
+    controller = controller or TrainingController(model, optimizer)
     model.train()
-    for epoch in range(epochs):
+    for epoch in range(controller.resume(), epochs):
         optimizer.zero_grad()
         embeddings_out = model(data)  # Forward pass to get refined embeddings, shape [N, D]
-        loss = contrastive_loss_vectorized(embeddings_out, data.edge_index, tau=tau)
+        loss = contrastive_loss_chunked(embeddings_out, data.edge_index, tau=tau, block_size=block_size,
+                                        negatives=negatives)
         loss.backward()
         # Apply gradient clipping to prevent exploding gradients
         torch.nn.utils.clip_grad_norm_(model.parameters(), clip_value)
         optimizer.step()
-        if loss.item() < best_loss:
-            best_loss = loss.item()
-            best_state = model.state_dict()
+        loss_value = loss.item()  # the only host sync of the epoch
         if epoch % 10 == 0:
-            logger.info(f"Epoch {epoch+1}, Loss: {loss.item():.4f}")
+            logger.info(f"Epoch {epoch+1}, Loss: {loss_value:.4f}, LR: {controller.lr():.2e}")
+        if controller.step(epoch, loss_value):
+            break
     logger.info("GNN training complete.")
-    logger.info(f"Best training loss: {best_loss:.4f}")
-    # best model state
-    if best_state is not None:
-        model.load_state_dict(best_state)
-    return model
-
-#training loop
-def main():
-    embeddings, user_ids = load_embeddings_from_csv("user_embeddings.csv")
+    return controller.finish()
+
+#peak resident memory of this process in MB (and peak allocated CUDA memory when training on GPU)
+def peak_memory_mb(device):
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # bytes on macOS, KB on linux
+
+
+#distributed setup from the torchrun environment (RANK, WORLD_SIZE, LOCAL_RANK), returns (rank, world_size, device).
+#a plain `python train.py` run is rank 0 of 1 and starts no process group
+def setup_distributed(backend="gloo"):
+    rank = int(os.environ.get("RANK", 0))
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if torch.cuda.is_available():
+        device = torch.device("cuda", int(os.environ.get("LOCAL_RANK", 0)))
+        torch.cuda.set_device(device)
+    else:
+        device = torch.device("cpu")
+    if world_size > 1:
+        dist.init_process_group(backend=backend, rank=rank, world_size=world_size)
+    return rank, world_size, device
+
+
+#this rank's share of the seed nodes, every rank gets the same number so all of them run the
+#same number of steps (DDP needs matching backward calls), the last N % world_size nodes are skipped
+def partition_nodes(num_nodes, rank, world_size, seed=42):
+    order = torch.randperm(num_nodes, generator=torch.Generator().manual_seed(seed))
+    per_rank = num_nodes // world_size
+    return order[rank * per_rank:(rank + 1) * per_rank]
+
+
+#torch.save to a temp file and rename, so a crash mid-write never leaves a truncated checkpoint
+def save_checkpoint(state_dict, path):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    torch.save(state_dict, tmp)
+    os.replace(tmp, path)
+
+
+#mini-batch training with neighbour sampling, each batch is batch_size seed nodes and their
+#sampled num_layers-hop subgraph (fanout neighbours per node per hop), so memory depends on the
+#batch rather than the graph size. the loss is computed for the seed nodes only, against the whole
+#subgraph: their sampled neighbours are positives and the rest are negatives.
+#the sampled neighbours of a seed are its in-neighbours (users whose KNN list contains it, the
+#nodes its messages come from), while train_gnn uses each node's own KNN list (out-neighbours) as
+#positives. both are near neighbours on a KNN graph and agree for mutual neighbours, but the two
+#objectives are not identical, so losses of the two modes are not directly comparable.
+#with world_size > 1 the model must be DDP-wrapped, each rank trains on its own partition of
+#seed nodes and gradients are averaged by DDP
+def train_gnn_minibatch(model, data, optimizer, epochs=200, tau=0.5, clip_value=1.0, batch_size=1024,
+                        fanout=10, num_layers=4, num_workers=0, negatives=None, rank=0, world_size=1,
+                        controller=None):
+    logger.info(f"Starting mini-batch GNN training (batch_size={batch_size}, fanout={fanout}, workers={num_workers}, "
+                f"ranks={world_size})...")
+    device = next(model.parameters()).device
+    input_nodes = partition_nodes(data.num_nodes, rank, world_size) if world_size > 1 else None
+    loader = NeighborLoader(data.cpu(), num_neighbors=[fanout] * num_layers, batch_size=batch_size, shuffle=True,
+                            input_nodes=input_nodes, num_workers=num_workers, persistent_workers=num_workers > 0)
+    controller = controller or TrainingController(model, optimizer, writer=rank == 0)
+    model.train()
+    for epoch in range(controller.resume(), epochs):
+        start = time.perf_counter()
+        # accumulated on the device, read back once per epoch
+        total_loss, seeds = torch.zeros((), dtype=torch.float64, device=device), 0
+        for batch in loader:
+            batch = batch.to(device)
+            optimizer.zero_grad()
+            embeddings_out = model(batch)
+            # sampled edges point at the seed nodes (message flow), flip them so seeds are the rows
+            seed_edges = batch.edge_index[:, batch.edge_index[1] < batch.batch_size].flip(0)
+            loss = contrastive_loss_chunked(embeddings_out, seed_edges, tau=tau, negatives=negatives,
+                                            rows=batch.batch_size)
+            loss.backward()
+            torch.nn.utils.clip_grad_norm_(model.parameters(), clip_value)
+            optimizer.step()
+            total_loss += loss.detach() * batch.batch_size
+            seeds += batch.batch_size
+        totals = torch.stack([total_loss, total_loss.new_tensor(seeds)])
+        if world_size > 1:
+            # every rank sees the global loss, so they all keep the same best state and stop together
+            dist.all_reduce(totals)
+        total_loss, seeds = totals.tolist()
+        epoch_loss = total_loss / max(seeds, 1)
+        if epoch % 10 == 0:
+            elapsed = time.perf_counter() - start
+            logger.info(f"Epoch {epoch+1}, Loss: {epoch_loss:.4f}, LR: {controller.lr():.2e}, "
+                        f"{seeds / elapsed:.0f} nodes/sec, peak memory {peak_memory_mb(device):.0f} MB")
+        if controller.step(epoch, epoch_loss):
+            break
+    logger.info("GNN training complete.")
+    return controller.finish()
+
+#training loop, batch_size=None trains full-batch. under torchrun with more than one process the
+#ranks train one DDP model on partitioned mini-batches (batch_size defaults to 1024 there)
+def main(batch_size=None, fanout=10, num_workers=0, backend="gloo", epochs=100, patience=20,
+         checkpoint_path="train_checkpoint.pt", registry_dir="models", promote=True):
+    setup_logging(int(os.environ.get("RANK", 0)))
+    set_seeds(42)
+    rank, world_size, device = setup_distributed(backend)
+    # cached stage, only texts that are not in embedding_cache/ yet are encoded (by rank 0, the
+    # other ranks wait and read its output)
+    if rank == 0:
+        embeddings, user_ids = build_embeddings(output_dir="embeddings", cache_dir="embedding_cache")
+    if world_size > 1:
+        dist.barrier()
+    if rank != 0:
+        embeddings, user_ids = load_embeddings("embeddings")
     logger.info(f"Loaded embeddings for {len(user_ids)} users.")
     
-    edge_list = build_knn_graph(embeddings, k=10)
-    data_obj = create_data_object(embeddings, edge_list)
+    edge_index = build_knn_graph(embeddings, k=10)
+    data_obj = create_data_object(embeddings, edge_index)
     
     # Embeddings are 768-dimensional from all-mpnet-base-v2.
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     model = customGNN(input_size=768, hidden_size=512, output_size=768).to(device)
+    if world_size > 1:
+        model = DistributedDataParallel(model, device_ids=[device.index] if device.type == "cuda" else None)
+        batch_size = batch_size or 1024
     optimizer = optim.Adam(model.parameters(), lr=0.005)
+    # a killed run picks up from checkpoint_path, which is removed once training finishes
+    controller = TrainingController(model, optimizer, patience=patience, checkpoint_path=checkpoint_path,
+                                    writer=rank == 0)
     
     data_obj = data_obj.to(device)
     logger.info("Beginning training loop...")
-    trained_model = train_gnn(model, data_obj, optimizer, epochs=100, tau=0.5, clip_value=1.0)
+    if batch_size:
+        trained_model = train_gnn_minibatch(model, data_obj, optimizer, epochs=epochs, tau=0.5, clip_value=1.0,
+                                            batch_size=batch_size, fanout=fanout, num_workers=num_workers,
+                                            rank=rank, world_size=world_size, controller=controller)
+    else:
+        trained_model = train_gnn(model, data_obj, optimizer, epochs=epochs, tau=0.5, clip_value=1.0,
+                                  controller=controller)
+    if world_size > 1:
+        trained_model = trained_model.module
+        dist.destroy_process_group()
+    if rank != 0:
+        return
     
-    # Save the best model to be served for inference
-    torch.save(trained_model.state_dict(), "trained_customGNN_best.pth")
-    logger.info("Training complete. Best model saved as trained_customGNN_best.pth")
+    # Register the best model as a new version, servers polling the registry pick it up once promoted
+    version = ModelRegistry(registry_dir).register(trained_model.state_dict(), {
+        "input_size": 768, "hidden_size": 512, "output_size": 768, "num_layers": 4,
+        "embedding_model": "all-mpnet-base-v2", "training_loss": controller.best_loss,
+        "best_epoch": controller.best_epoch, "num_users": len(user_ids), "knn_k": 10,
+    }, promote=promote)
+    logger.info(f"Training complete. Best model registered as {version} in {registry_dir}")
     
     # Optionally, run inference to see refined embeddings.
     trained_model.eval()
@@ -209,4 +434,17 @@ def main():
     logger.info(f"Refined embeddings shape: {refined_embeddings.shape}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train customGNN on the essay embeddings")
+    parser.add_argument("--batch-size", type=int, default=None, help="seed nodes per mini-batch, full-batch when omitted")
+    parser.add_argument("--fanout", type=int, default=10, help="neighbours sampled per node per hop")
+    parser.add_argument("--workers", type=int, default=0, help="DataLoader workers prefetching mini-batches")
+    parser.add_argument("--backend", default="gloo", help="torch.distributed backend when launched with torchrun")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--patience", type=int, default=20, help="stop after this many epochs without improvement")
+    parser.add_argument("--checkpoint", default="train_checkpoint.pt", help="periodic checkpoint used to resume a killed run")
+    parser.add_argument("--registry", default="models", help="model registry directory the new version is saved to")
+    parser.add_argument("--no-promote", action="store_true", help="register the version without making it the latest")
+    args = parser.parse_args()
+    main(batch_size=args.batch_size, fanout=args.fanout, num_workers=args.workers, backend=args.backend,
+         epochs=args.epochs, patience=args.patience, checkpoint_path=args.checkpoint,
+         registry_dir=args.registry, promote=not args.no_promote)
@@ -14,22 +14,18 @@
 # Set the PYTHONPATH to the current directory
 export PYTHONPATH=$(pwd)
 
-# Activate the virtual environment
+# Activate the virtual environment (server/requirements-train.txt, pyg-lib is needed by NeighborLoader)
 source /home/m/mannan2/hckth/venv/bin/activate
 
 # Define resource parameters
-ntasks=1
 cpus_per_task=4
-mem_per_task=20GB
-gpus_per_task=1
+mem=80GB
 total_gpus=4
 
-# Loop over available GPUs (0 to total_gpus - 1)
-for ((i=0; i<total_gpus; i++)); do
-  # Set the CUDA_VISIBLE_DEVICES to restrict each run to a specific GPU
-  export CUDA_VISIBLE_DEVICES=$i
-  srun --ntasks="$ntasks" --mem="$mem_per_task" --gpus="$gpus_per_task" --exact \
-       python project/train.py &
-done
+# Encode the corpus once up front, the ranks below then only read the cached embeddings
+python project/embed_corpus.py --output embeddings --cache embedding_cache
 
-wait
\ No newline at end of file
+# One DDP job with a rank per GPU, each rank trains on its own partition of seed nodes and only
+# rank 0 logs and writes the checkpoint (use --backend gloo to run the same job on CPU)
+srun --ntasks=1 --mem="$mem" --gpus="$total_gpus" --cpus-per-task="$((cpus_per_task * total_gpus))" --exact \
+     torchrun --standalone --nproc_per_node="$total_gpus" project/train.py --batch-size 1024 --backend nccl